@@ -0,0 +1,321 @@
+# api.py
+#
+#   uvicorn api:app --host 0.0.0.0 --port 8000
+#
+# Headless HTTP API next to the Streamlit UI, for LMS integrations and
+# scripts. It drives the same utils functions as pages/1_chatbot.py (model
+# router, context window, response cache, PDF store, background jobs,
+# history store) without Streamlit's per-session script reruns. Clients log
+# in once and send the session token as "Authorization: Bearer <token>".
+# Streaming endpoints use server-sent events.
+
+import asyncio
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+from fastapi import Depends, FastAPI, File, Header, HTTPException, Request, UploadFile
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+from utils import metrics
+from utils.auth_service import AuthBusy, AuthError, authenticate
+from utils.context_window import ContextWindow, llm_summarizer
+from utils.history_search import search_history
+from utils.history_store import append_history, clear_history, load_archived, load_history
+from utils.jobs import JobLimitReached, JobRunner
+from utils.llm_client import LLMError
+from utils.model_router import get_model_router
+from utils.pdf_extract import open_document, open_pdf_upload
+from utils.pdf_tasks import PDF_ACTIONS, chat_cache_context, ground_in_pdf, run_pdf_task
+from utils.response_cache import get_response_cache
+from utils.session_store import get_session_store
+from utils.text_compact import compaction_stats
+from utils.user_store import get_user_store
+
+load_dotenv()
+
+API_JOBS_PER_USER = int(os.getenv("EDUBOT_API_JOBS_PER_USER", 32))  # batch submissions queue up to this
+MAX_CONTEXT_WINDOWS = 1024     # per-user ContextWindow objects kept in memory
+JOB_POLL_INTERVAL = 0.5        # seconds between progress events on /jobs/{id}/events
+
+_DIGEST_RE = re.compile(r"^[0-9a-f]{64}$")
+
+app = FastAPI(title="EduBot API")
+model_router = get_model_router()
+response_cache = get_response_cache()
+# The API has its own job table; its jobs write their result to history themselves
+job_runner = JobRunner(max_active_per_user=API_JOBS_PER_USER)
+
+_user_locks = {}               # username -> lock serializing that user's chat turns
+_user_locks_lock = threading.Lock()
+_windows = OrderedDict()       # username -> ContextWindow (LRU)
+
+
+# ───── request bodies ─────
+class LoginRequest(BaseModel):
+    username: str
+    password: str
+
+
+class ChatRequest(BaseModel):
+    message: str
+    stream: bool = False
+    pdf_id: str | None = None  # ground the answer in this uploaded PDF
+
+
+class TaskRequest(BaseModel):
+    action: str = "Summarize"  # "Summarize" | "Generate Questions"
+    offline: bool = False      # questions from the local engine, no LLM
+
+
+class BatchTask(TaskRequest):
+    pdf_id: str
+
+
+# ───── helpers ─────
+def _user_lock(username):
+    with _user_locks_lock:
+        return _user_locks.setdefault(username, threading.Lock())
+
+
+def _context_window(username):
+    # Caller holds the user's lock
+    window = _windows.pop(username, None) or ContextWindow(summarize=llm_summarizer(model_router.asker("chat")))
+    _windows[username] = window
+    while len(_windows) > MAX_CONTEXT_WINDOWS:
+        _windows.popitem(last=False)
+    return window
+
+
+def _document(pdf_id):
+    doc = open_document(pdf_id) if _DIGEST_RE.match(pdf_id or "") else None
+    if doc is None:
+        raise HTTPException(404, "Unknown pdf_id; upload the PDF again.")
+    return doc
+
+
+def _sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+def _public_job(job):
+    return {key: job[key] for key in ("id", "label", "state", "done", "total", "result", "error", "created", "finished")}
+
+
+def current_user(authorization: str = Header(default="")):
+    scheme, _, token = authorization.partition(" ")
+    username = get_session_store().validate(token) if scheme.lower() == "bearer" else None
+    if username is None:
+        raise HTTPException(401, "Missing or expired session token.", headers={"WWW-Authenticate": "Bearer"})
+    return username
+
+
+# ───── auth ─────
+@app.post("/api/login")
+def login(body: LoginRequest, request: Request):
+    try:
+        valid = authenticate(get_user_store(), body.username, body.password,
+                             ip=request.client.host if request.client else None)
+    except AuthBusy as e:
+        raise HTTPException(503, str(e))
+    except AuthError as e:  # throttled
+        raise HTTPException(429, str(e), headers={"Retry-After": str(int(getattr(e, "retry_after", 1)) + 1)})
+    if not valid:
+        raise HTTPException(401, "Invalid username or password.")
+    return {"token": get_session_store().create(body.username), "username": body.username}
+
+
+@app.post("/api/logout")
+def logout(authorization: str = Header(default=""), username: str = Depends(current_user)):
+    get_session_store().revoke(authorization.partition(" ")[2])
+    return {"ok": True}
+
+
+# ───── history ─────
+@app.get("/api/history")
+def get_history(offset: int = 0, limit: int = 100, username: str = Depends(current_user)):
+    # The recent (hot) part of the conversation; `start` is the position of
+    # its first message, older ones come from /api/history/archive
+    history = load_history(username)
+    return {"total": len(history), "start": history.start,
+            "messages": history[max(0, offset):max(0, offset) + max(0, limit)]}
+
+
+@app.get("/api/history/archive")
+def get_archived(before: int, username: str = Depends(current_user)):
+    start, messages = load_archived(username, before)
+    return {"start": start, "messages": messages}
+
+
+@app.get("/api/history/search")
+def search(q: str, limit: int = 20, username: str = Depends(current_user)):
+    return {"results": search_history(username, q, max(1, min(limit, 100)))}
+
+
+@app.delete("/api/history")
+def delete_history(username: str = Depends(current_user)):
+    with _user_lock(username):
+        clear_history(username)
+        _windows.pop(username, None)
+    return {"ok": True}
+
+
+# ───── chat ─────
+def _chat_turn(username, message, doc, on_delta=None):
+    # One chat turn, same flow as the page: response cache, context window,
+    # optional PDF grounding, model router. The turn is appended to the log,
+    # never saved from this request's copy of the history, so turns written
+    # meanwhile by the page or by jobs are kept.
+    with _user_lock(username):
+        history = load_history(username)
+        cache_context = chat_cache_context(history, doc)
+        history.append({"role": "user", "content": message})
+        reply = response_cache.get(message, cache_context)
+        if reply is None:
+            messages = _context_window(username).build(history)
+            if doc is not None:
+                messages = ground_in_pdf(messages, doc, message)
+            if on_delta:
+                reply = model_router.collect_stream(messages, on_delta)
+            else:
+                reply = model_router.ask(messages)
+            response_cache.put(message, reply, cache_context)
+        append_history(username, history[-1], {"role": "assistant", "content": reply})
+    return reply
+
+
+async def _stream_chat(username, message, doc):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    sent = 0
+
+    def on_delta(partial):
+        nonlocal sent
+        delta, sent = partial[sent:], len(partial)
+        loop.call_soon_threadsafe(queue.put_nowait, ("delta", {"text": delta}))
+
+    def put(event, payload):
+        loop.call_soon_threadsafe(queue.put_nowait, (event, payload))
+
+    def work():
+        try:
+            reply = _chat_turn(username, message, doc, on_delta)
+            if not sent:  # answered from the cache: one delta with the whole reply
+                on_delta(reply)
+            put("done", {"reply": reply})
+        except LLMError as e:
+            put("error", {"error": str(e), "partial": e.partial})
+        except Exception as e:  # e.g. the history write failed; the stream must still end
+            put("error", {"error": f"Internal error: {type(e).__name__}", "partial": None})
+        finally:
+            put(None, None)
+
+    # The turn keeps running (and is saved) even if the client disconnects
+    loop.run_in_executor(None, work)
+    while True:
+        event, payload = await queue.get()
+        if event is None:
+            break
+        yield _sse(event, payload)
+
+
+@app.post("/api/chat")
+async def chat(body: ChatRequest, username: str = Depends(current_user)):
+    doc = _document(body.pdf_id) if body.pdf_id else None
+    if body.stream:
+        return StreamingResponse(_stream_chat(username, body.message, doc), media_type="text/event-stream")
+    try:
+        reply = await asyncio.to_thread(_chat_turn, username, body.message, doc)
+    except LLMError as e:
+        raise HTTPException(e.status if e.status and e.status >= 500 else 502, str(e))
+    return {"reply": reply}
+
+
+# ───── PDFs and background tasks ─────
+@app.post("/api/pdf")
+def upload_pdf(file: UploadFile = File(...), username: str = Depends(current_user)):
+    try:
+        doc = open_pdf_upload(file.file)
+        stats = compaction_stats(doc)
+    except Exception as e:
+        raise HTTPException(422, f"Failed to read PDF: {e}")
+    return {"pdf_id": doc.digest, "pages": len(doc), "compaction": stats}
+
+
+def _submit_task(username, doc, task):
+    if task.action not in PDF_ACTIONS:
+        raise HTTPException(422, f"action must be one of {list(PDF_ACTIONS)}")
+    label = f"PDF Task: {task.action}"
+
+    def run(progress):
+        reply, note = run_pdf_task(doc, task.action, model_router.asker("long"), task.offline, progress)
+        append_history(username, {"role": "user", "content": label}, {"role": "assistant", "content": reply})
+        return {"reply": reply, "note": note}
+
+    try:
+        return job_runner.submit(username, label, run)
+    except JobLimitReached as e:
+        raise HTTPException(429, str(e))
+
+
+@app.post("/api/pdf/{pdf_id}/tasks")
+def submit_task(pdf_id: str, body: TaskRequest, username: str = Depends(current_user)):
+    return {"job_id": _submit_task(username, _document(pdf_id), body)}
+
+
+@app.post("/api/tasks/batch")
+def submit_batch(body: list[BatchTask], username: str = Depends(current_user)):
+    # Documents are resolved up front so a bad pdf_id rejects the whole batch
+    docs = [_document(task.pdf_id) for task in body]
+    return {"job_ids": [_submit_task(username, doc, task) for doc, task in zip(docs, body)]}
+
+
+@app.get("/api/jobs")
+def list_jobs(username: str = Depends(current_user)):
+    return {"jobs": [_public_job(job) for job in job_runner.jobs(username)]}
+
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: int, username: str = Depends(current_user)):
+    job = job_runner.get(username, job_id)
+    if job is None:
+        raise HTTPException(404, "Unknown job.")
+    return _public_job(job)
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: int, username: str = Depends(current_user)):
+    if job_runner.get(username, job_id) is None:
+        raise HTTPException(404, "Unknown job.")
+
+    async def events():
+        last = None
+        while True:
+            job = job_runner.get(username, job_id)
+            if job is None:
+                return
+            state = (job["state"], job["done"], job["total"])
+            if state != last:
+                last = state
+                yield _sse("progress", _public_job(job) if job["finished"] else
+                           {"state": job["state"], "done": job["done"], "total": job["total"]})
+            if job["finished"]:
+                return
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# ───── ops ─────
+@app.get("/healthz")
+def healthz():
+    return {"status": "ok", "models": model_router.stats()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    return metrics.render_prometheus()
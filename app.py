@@ -1,41 +1,25 @@
 import streamlit as st
 import json
-import bcrypt
 import os
-from streamlit_lottie import st_lottie
-import requests
-import random, smtplib, ssl, time
-from email.message import EmailMessage
+import random, time
 from dotenv import load_dotenv
 from streamlit_js_eval import streamlit_js_eval  # 🔑 for setting cookies
+from utils import metrics
+from utils.user_store import get_user_store, valid_username
+from utils.session_store import SESSION_COOKIE, SESSION_TTL, get_session_store, session_user
+from utils.auth_service import AuthError, authenticate, hash_password
 
 load_dotenv()
-COOKIE_KEY = "eduyy_user"
-COOKIE_EXPIRY = 7 * 24 * 60 * 60  # 7 days
 
-def set_cookie(key, value, days_expire=7):
+# Only writing the cookie needs JS; reading it goes through st.context.cookies
+def set_cookie(key, value, max_age=SESSION_TTL):
     streamlit_js_eval(
         js_code=f"""
-        var d = new Date();
-        d.setTime(d.getTime() + ({days_expire}*24*60*60*1000));
-        document.cookie = "{key}=" + {json.dumps(value)} + "; expires=" + d.toUTCString() + "; path=/";
+        document.cookie = "{key}=" + {json.dumps(value)} + "; max-age={max_age}; path=/; SameSite=Lax";
         """,
         key="set_cookie"
     )
 
-def get_cookie(key):
-    cookies = streamlit_js_eval(js_code="document.cookie", key="get_cookie")
-    if cookies:
-        cookies = dict(c.split("=", 1) for c in cookies.split("; "))
-        return cookies.get(key)
-    return None
-
-def delete_cookie(key):
-    streamlit_js_eval(
-        js_code=f'document.cookie = "{key}=; expires=Thu, 01 Jan 1970 00:00:00 UTC; path=/;"',
-        key="delete_cookie"
-    )
-
 st.set_page_config(page_title="EduyyBot", page_icon="📘")
 
 # Initialize session state keys to avoid key errors
@@ -54,64 +38,73 @@ SMTP_SERVER   = os.getenv("SMTP_SERVER")     # e.g. "smtp.gmail.com"
 SMTP_PORT     = int(os.getenv("SMTP_PORT", 587))
 SMTP_USER     = os.getenv("SMTP_USER")       # your email
 SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")   # your app-password
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"  # 0 for a local plain-text test server
+
+# Mail, SMTP and TLS modules are only imported on the forgot-password path
+def mail_dispatcher():
+    from utils.mailer import get_mail_dispatcher
+    return get_mail_dispatcher(SMTP_SERVER, SMTP_PORT, SMTP_USER, SMTP_PASSWORD, SMTP_STARTTLS)
 
+# Queues the OTP mail on the background dispatcher (pooled SMTP connection)
+# and returns a job id; poll mail_dispatcher().status(job_id).
 def send_otp_email(to_email, otp):
+    from email.message import EmailMessage
     msg = EmailMessage()
     msg["Subject"] = "EduyyBot OTP Verification"
-    msg["From"] = os.getenv("SMTP_USER")
+    msg["From"] = SMTP_USER
     msg["To"] = to_email
     msg.set_content(
         f"Hi 👋,\n\nYour EduyyBot OTP is: {otp}\nIt is valid for 5 minutes.\n\nIf you didn't request this, ignore this email."
     )
-    context = ssl.create_default_context()
-    with smtplib.SMTP(os.getenv("SMTP_SERVER"), int(os.getenv("SMTP_PORT"))) as server:
-        server.starttls(context=context)
-        server.login(os.getenv("SMTP_USER"), os.getenv("SMTP_PASSWORD"))
-        server.send_message(msg)
+    return mail_dispatcher().submit(msg)
 
+# Users live in users.json, cached and indexed in process by utils.user_store
 def load_users():
-    try:
-        with open('users.json', 'r') as file:
-            return json.load(file)
-    except FileNotFoundError:
-        return {"users": []}
+    return get_user_store().load()
 
 # Save users to JSON
 def save_users(users):
-    with open('users.json', 'w') as file:
-        json.dump(users, file, indent=4)
-
-# Check credentials
+    get_user_store().save(users)
+
+# X-Forwarded-For is only believed when we sit behind that many proxies of
+# our own, and then only the entry our outermost proxy appended; the rest is
+# whatever the client sent. Without a trustworthy address there is no per-IP
+# throttling (the per-username limit still applies).
+TRUSTED_PROXY_HOPS = int(os.getenv("EDUBOT_TRUSTED_PROXY_HOPS", 0))
+
+def client_ip():
+    ctx = getattr(st, "context", None)
+    if TRUSTED_PROXY_HOPS:
+        headers = getattr(ctx, "headers", None) or {}
+        hops = [h.strip() for h in headers.get("X-Forwarded-For", "").split(",") if h.strip()]
+        return hops[-TRUSTED_PROXY_HOPS] if len(hops) >= TRUSTED_PROXY_HOPS else None
+    return getattr(ctx, "ip_address", None) or None
+
+# Check credentials (bcrypt runs in the auth process pool; raises
+# LoginThrottled / AuthBusy under attempt bursts)
 def check_user_credentials(username, password):
-    users = load_users()
-    for user in users["users"]:
-        if user["username"] == username and bcrypt.checkpw(password.encode(), user["password"].encode()):
-            return True
-    return False
+    return authenticate(get_user_store(), username, password, ip=client_ip())
 
 # Add new user
 def add_new_user(email, username, password):
-    hashed_password = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
-    users = load_users()
-    users["users"].append({
+    hashed_password = hash_password(password)
+    get_user_store().add_user({
         "email": email,
         "username": username,
         "password": hashed_password,
     })
-    save_users(users)
 
 
-# ───── AUTO LOGIN VIA COOKIE (persists across browser refresh) ─────
+# ───── AUTO LOGIN VIA SESSION COOKIE (persists across browser refresh) ─────
 if not st.session_state["is_logged_in"]:
-    cookie_user = get_cookie(COOKIE_KEY)
+    cookie_user = session_user(st.context.cookies)
     if cookie_user:
-        users = load_users()
-        if any(u["username"] == cookie_user for u in users["users"]):
-            st.session_state["is_logged_in"] = True
-            st.session_state["logged_once"] = True
-            st.session_state["username"] = cookie_user
-            st.session_state["page"] = "chatbot"
-            st.switch_page("pages/1_chatbot.py")
+        st.session_state["is_logged_in"] = True
+        st.session_state["logged_once"] = True
+        st.session_state["username"] = cookie_user
+        st.session_state["session_token"] = st.context.cookies.get(SESSION_COOKIE)
+        st.session_state["page"] = "chatbot"
+        st.switch_page("pages/1_chatbot.py")
 
 
 def inject_css():
@@ -200,6 +193,7 @@ def inject_css():
 
 
 def main():
+    metrics.start_exporter()
     inject_css()
 
     st.markdown("<div class='auth-title'>EduBot</div>", unsafe_allow_html=True)
@@ -207,7 +201,7 @@ def main():
 
     option = st.selectbox("Choose an option", ["Log In", "Sign Up"], label_visibility="collapsed")
 
-    users_data = load_users()
+    user_store = get_user_store()
 
     if option == "Sign Up":
         email = st.text_input("Email", placeholder="Enter your email")
@@ -217,11 +211,11 @@ def main():
         if st.button("Sign Up"):
             if not (email and username and password):
                 st.error("Please fill in all fields")
+            elif not valid_username(username):
+                st.error("Usernames may only use letters, digits, '_', '-' and '.' (up to 64 characters).")
             else:
-                users = load_users()
-
-                email_taken = any(u["email"] == email for u in users["users"])
-                user_taken = any(u["username"] == username for u in users["users"])
+                email_taken = user_store.email_exists(email)
+                user_taken = user_store.username_exists(username)
 
                 if email_taken or user_taken:
                     dup_msg = []
@@ -243,16 +237,24 @@ def main():
         if st.button("Log In"):
             if not (login_username and login_password):
                 st.error("Please fill both fields.")
-            elif check_user_credentials(login_username, login_password):
-                st.session_state["is_logged_in"] = True
-                st.session_state["logged_once"] = True
-                st.session_state.username = login_username
-                set_cookie(COOKIE_KEY, login_username)
-                st.success(f"Welcome {login_username}! Redirecting to Bot…")
-                st.session_state["page"] = "chatbot"
-                st.rerun()
             else:
-                st.error("Invalid username or password.")
+                try:
+                    valid = check_user_credentials(login_username, login_password)
+                except AuthError as e:  # throttled or auth pool saturated
+                    valid = None
+                    st.error(str(e))
+                if valid:
+                    st.session_state["is_logged_in"] = True
+                    st.session_state["logged_once"] = True
+                    st.session_state.username = login_username
+                    token = get_session_store().create(login_username)
+                    st.session_state["session_token"] = token
+                    set_cookie(SESSION_COOKIE, token)
+                    st.success(f"Welcome {login_username}! Redirecting to Bot…")
+                    st.session_state["page"] = "chatbot"
+                    st.rerun()
+                elif valid is False:
+                    st.error("Invalid username or password.")
 
         st.markdown("<div class='link-row'>or</div>", unsafe_allow_html=True)
 
@@ -268,8 +270,9 @@ def main():
         if st.session_state.fp_stage == 1:
             email_input = st.text_input("Enter your registered e‑mail")
             if st.button("Send OTP"):
-                user = next((u for u in users_data["users"]
-                             if u["username"] == login_username and u["email"] == email_input), None)
+                user = user_store.get_by_username(login_username)
+                if user and user["email"] != email_input:
+                    user = None
                 if not login_username:
                     st.error("Enter your username above first.")
                 elif not email_input:
@@ -278,17 +281,26 @@ def main():
                     st.error("Username & e‑mail pair not found.")
                 else:
                     otp = f"{random.randint(100000, 999999)}"
-                    try:
-                        send_otp_email(email_input, otp)
+                    job_id = send_otp_email(email_input, otp)
+                    if mail_dispatcher().status(job_id)["state"] == "rate_limited":
+                        st.error("Too many OTP requests for this e‑mail. Try again later.")
+                    else:
                         st.session_state.fp_otp = otp
                         st.session_state.fp_username = login_username
                         st.session_state.fp_timestamp = time.time()
+                        st.session_state.fp_mail_job = job_id
                         st.session_state.fp_stage = 2
-                        st.success("OTP sent! Check your inbox.")
-                    except Exception as e:
-                        st.error(f"E‑mail failed ➜ {e}")
+                        st.success("OTP is on its way! Check your inbox.")
 
         # ► Stage‑2: verify OTP & set new password
+        if st.session_state.fp_stage == 2:
+            delivery = mail_dispatcher().status(st.session_state.fp_mail_job)
+            if delivery["state"] == "failed":
+                st.error(f"E‑mail failed ➜ {delivery['error']}")
+                st.session_state.fp_stage = 1
+            elif delivery["state"] in ("queued", "sending"):
+                st.caption("📨 Sending OTP e‑mail…")
+
         if st.session_state.fp_stage == 2:
             entered_otp = st.text_input("Enter the 6‑digit OTP")
             new_pw1 = st.text_input("New password", type="password")
@@ -305,14 +317,11 @@ def main():
                     st.error("Passwords don’t match or are empty.")
                 else:
                     # store new password
-                    for usr in users_data["users"]:
-                        if usr["username"] == st.session_state.fp_username:
-                            usr["password"] = bcrypt.hashpw(new_pw1.encode(), bcrypt.gensalt()).decode()
-                            save_users(users_data)
-                            break
+                    user_store.update_user(st.session_state.fp_username, password=hash_password(new_pw1))
+                    get_session_store().revoke_user(st.session_state.fp_username)
                     st.success("Password reset! Please log in with the new password.")
                     # clear fp session keys
-                    for k in ("fp_stage", "fp_otp", "fp_username", "fp_timestamp"):
+                    for k in ("fp_stage", "fp_otp", "fp_username", "fp_timestamp", "fp_mail_job"):
                         st.session_state.pop(k, None)
 
 
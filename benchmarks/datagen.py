@@ -0,0 +1,72 @@
+# benchmarks/datagen.py
+
+import json
+import random
+
+import bcrypt
+
+# Synthetic data for the benchmarks. Everything is seeded so runs are
+# comparable.
+
+TOPIC_WORDS = """
+gradient descent neural network backpropagation activation function loss function
+learning rate regularization overfitting validation set training data decision tree
+random forest support vector machine kernel trick feature scaling normalization
+probability distribution expectation variance covariance matrix eigenvalue eigenvector
+linear regression logistic regression convolution pooling layer recurrent network
+attention mechanism transformer embedding tokenizer optimizer momentum batch size epoch
+""".split()
+FILLER = "the a of to in and is that for with as by on this which are be from can it an".split()
+
+
+def make_sentence(rng, n_words=None):
+    n_words = n_words or rng.randint(10, 24)
+    words = [rng.choice(TOPIC_WORDS) if rng.random() < 0.45 else rng.choice(FILLER) for _ in range(n_words)]
+    return " ".join(words).capitalize() + "."
+
+
+def make_text(n_words, seed=0):
+    rng = random.Random(seed)
+    paragraphs, count = [], 0
+    while count < n_words:
+        sentences = [make_sentence(rng) for _ in range(rng.randint(3, 7))]
+        paragraphs.append(" ".join(sentences))
+        count += sum(len(s.split()) for s in sentences)
+    return "\n\n".join(paragraphs)
+
+
+def make_users(n, path, password="benchmark-pw", rounds=None):
+    # One shared hash keeps generation fast; lookups don't care. The cost
+    # factor defaults to the app's, so logins don't pay for a hash upgrade.
+    from utils.auth_service import BCRYPT_ROUNDS
+    hashed = bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds or BCRYPT_ROUNDS)).decode()
+    users = [{"email": f"user{i}@example.com", "username": f"user{i}", "password": hashed} for i in range(n)]
+    with open(path, "w") as f:
+        json.dump({"users": users}, f, indent=4)
+    return users
+
+
+def make_history(n_messages, seed=0):
+    rng = random.Random(seed)
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant",
+         "content": " ".join(make_sentence(rng) for _ in range(1 if i % 2 == 0 else 4))}
+        for i in range(n_messages)
+    ]
+
+
+def make_pdf(n_pages, path, seed=0, words_per_page=350):
+    # Needs the optional pymupdf package (already in requirements.txt).
+    try:
+        import pymupdf
+    except ImportError:
+        import fitz as pymupdf
+    rng = random.Random(seed)
+    doc = pymupdf.open()
+    for page_no in range(n_pages):
+        page = doc.new_page()
+        body = make_text(words_per_page, seed=rng.randrange(1 << 30))
+        page.insert_textbox(pymupdf.Rect(50, 60, 545, 790), f"Course Notes - page {page_no + 1}\n\n{body}", fontsize=9)
+    doc.save(path)
+    doc.close()
+    return path
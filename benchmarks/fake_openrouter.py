@@ -0,0 +1,119 @@
+# benchmarks/fake_openrouter.py
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# A local stand-in for the OpenRouter chat-completions endpoint. It answers
+# both plain and `"stream": true` (SSE) requests with a canned reply after a
+# configurable latency, emitting tokens at a configurable rate.
+
+DEFAULT_REPLY = (
+    "Sure! Here is a short explanation. Gradient descent updates each weight in the "
+    "opposite direction of the gradient of the loss, scaled by a learning rate."
+)
+
+
+class FakeOpenRouter:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, tokens_per_second=0.0,
+                 reply=DEFAULT_REPLY, fail_every=0):
+        self.latency = latency                      # seconds before the first byte
+        self.tokens_per_second = tokens_per_second  # 0 = send everything at once
+        self.reply = reply
+        self.fail_every = fail_every                # every Nth request returns 503
+        self.requests = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with server._lock:
+                    server.requests += 1
+                    n = server.requests
+                time.sleep(server.latency)
+                if server.fail_every and n % server.fail_every == 0:
+                    return self._send_json(503, {"error": {"message": "fake overload"}}, {"Retry-After": "0"})
+                model = body.get("model", "fake/model")
+                if body.get("stream"):
+                    return self._stream(model)
+                return self._send_json(200, {
+                    "id": f"fake-{n}",
+                    "model": model,
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": server.reply}}],
+                    "usage": {"prompt_tokens": len(json.dumps(body)) // 4, "completion_tokens": len(server.reply) // 4},
+                })
+
+            def _send_json(self, status, payload, headers=None):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, model):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                self.wfile.write(b": OPENROUTER PROCESSING\n\n")
+                delay = 1.0 / server.tokens_per_second if server.tokens_per_second else 0.0
+                for token in server.reply.split(" "):
+                    chunk = {"model": model, "choices": [{"index": 0, "delta": {"content": token + " "}}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                    self.wfile.flush()
+                    if delay:
+                        time.sleep(delay)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake OpenRouter chat-completions server")
+    parser.add_argument("--port", type=int, default=8999)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    args = parser.parse_args()
+    server = FakeOpenRouter(port=args.port, latency=args.latency, tokens_per_second=args.tokens_per_second)
+    print(f"Fake OpenRouter listening on {server.base_url} (set OPENROUTER_BASE_URL to this)")
+    server.httpd.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+# benchmarks/loadtest.py
+#
+#   python benchmarks/loadtest.py                               # 1,5,10,25 users
+#   python benchmarks/loadtest.py --users 10,50,100 --turns 5 --latency 0.5 --tokens-per-second 40
+#   python benchmarks/loadtest.py --pdf-every 2 --out load.json
+#
+# Simulates concurrent students against a local fake OpenRouter server. Each
+# simulated session runs in its own thread and goes through the same code the
+# Streamlit pages call: sign-up/login (hash_password / authenticate / session
+# store, as in app.py), chat turns (context window, response cache, model
+# router, save_history, as in pages/1_chatbot.py) and PDF tasks (upload into
+# the document store, background job, claim into history). Reports
+# throughput, p50/p95/p99 turn latency and resident memory per session for
+# each concurrency level.
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.datagen import make_history, make_pdf, make_sentence  # noqa: E402
+from benchmarks.fake_openrouter import FakeOpenRouter  # noqa: E402
+
+FAST_AUTH_ROUNDS = 4             # --fast-auth bcrypt cost (the app's default is 12)
+
+
+def rss_bytes():
+    # Current resident set size; /proc on Linux, peak RSS elsewhere
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Session:
+    # What one browser session holds in st.session_state, minus the widgets
+
+    def __init__(self, username, rng, pdf_path, args):
+        from utils.context_window import ContextWindow, llm_summarizer
+        from utils.model_router import get_model_router
+        self.username = username
+        self.rng = rng
+        self.pdf_path = pdf_path
+        self.args = args
+        self.router = get_model_router()
+        self.history = []
+        self.window = ContextWindow(summarize=llm_summarizer(self.router.asker("chat")))
+        self.pdf_doc = None
+        self.token = None
+        self.turns = []       # seconds per chat turn
+        self.first_token = [] # seconds to the first streamed delta
+        self.pdf_tasks = []   # seconds per PDF task, submit to result in history
+        self.errors = 0
+
+    # ───── app.py ─────
+    def login(self, signup):
+        from utils.auth_service import authenticate, hash_password
+        from utils.session_store import get_session_store
+        from utils.user_store import get_user_store
+        store = get_user_store()
+        if signup:
+            store.add_user({"email": f"{self.username}@example.com", "username": self.username,
+                            "password": hash_password("load-test-pw")})
+        if not authenticate(store, self.username, "load-test-pw"):
+            raise RuntimeError(f"login failed for {self.username}")
+        self.token = get_session_store().create(self.username)
+
+    # ───── pages/1_chatbot.py ─────
+    def restore(self):
+        from utils.history_store import load_history
+        from utils.session_store import get_session_store
+        assert get_session_store().validate(self.token) == self.username
+        self.history = load_history(self.username)
+
+    def chat_turn(self):
+        from utils.history_store import save_history
+        from utils.llm_client import LLMError
+        from utils.pdf_tasks import chat_cache_context, ground_in_pdf
+        from utils.response_cache import get_response_cache
+        # Distinct questions so the response cache does not flatter the numbers
+        message = make_sentence(self.rng)
+        cache = get_response_cache()
+        start = time.perf_counter()
+        first = []
+        context = chat_cache_context(self.history, self.pdf_doc)
+        self.history.append({"role": "user", "content": message})
+        try:
+            reply = cache.get(message, context)
+            if reply is None:
+                messages = self.window.build(self.history)
+                if self.pdf_doc is not None:
+                    messages = ground_in_pdf(messages, self.pdf_doc, message)
+                if self.args.stream:
+                    reply = self.router.collect_stream(
+                        messages, on_delta=lambda _: first or first.append(time.perf_counter() - start)
+                    )
+                else:
+                    reply = self.router.ask(messages)
+                cache.put(message, reply, context)
+        except LLMError:
+            self.history.pop()
+            self.errors += 1
+            return
+        self.history.append({"role": "assistant", "content": reply})
+        save_history(self.username, self.history)
+        self.turns.append(time.perf_counter() - start)
+        self.first_token.extend(first)
+
+    def pdf_task(self):
+        from utils.history_store import save_history
+        from utils.jobs import get_job_runner
+        from utils.pdf_extract import open_pdf_upload
+        from utils.pdf_tasks import run_pdf_task
+        from utils.text_compact import compaction_stats
+        start = time.perf_counter()
+        with open(self.pdf_path, "rb") as f:
+            self.pdf_doc = open_pdf_upload(f)
+        compaction_stats(self.pdf_doc)
+        doc, ask = self.pdf_doc, self.router.asker("long")
+        runner = get_job_runner()
+        runner.submit(self.username, "PDF Task: Summarize",
+                      lambda progress: run_pdf_task(doc, "Summarize", ask, False, progress))
+        # The page's sidebar fragment polls every 2 s; poll faster here so the
+        # measurement is the job, not the poll interval
+        while not runner.has_finished(self.username):
+            time.sleep(0.05)
+        for job in runner.claim_finished(self.username):
+            if job["state"] != "done":
+                self.errors += 1
+                continue
+            reply, _ = job["result"]
+            self.history += [{"role": "user", "content": job["label"]}, {"role": "assistant", "content": reply}]
+            save_history(self.username, self.history)
+        self.pdf_tasks.append(time.perf_counter() - start)
+
+    def run(self, signup, barrier):
+        barrier.wait()
+        self.login(signup)
+        self.restore()
+        for turn in range(self.args.turns):
+            if self.args.pdf_every and turn == 0 and self.rng.random() < 1 / self.args.pdf_every:
+                self.pdf_task()
+            self.chat_turn()
+            if self.args.think_time:
+                time.sleep(self.rng.uniform(0, 2 * self.args.think_time))
+
+
+def run_level(n_users, level, pdf_path, args):
+    from utils.history_store import append_history
+    sessions = [Session(f"load{level}_{i}", random.Random(f"load{level}_{i}"), pdf_path, args) for i in range(n_users)]
+    if args.history:
+        for s in sessions:  # returning students with an existing transcript
+            append_history(s.username, *make_history(args.history, seed=zlib.crc32(s.username.encode())))
+    barrier = threading.Barrier(n_users + 1)
+    threads = [threading.Thread(target=s.run, args=(args.signup, barrier), daemon=True) for s in sessions]
+    rss_before = rss_bytes()
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    peak = rss_before
+    while any(t.is_alive() for t in threads):
+        peak = max(peak, rss_bytes())
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    turns = [x for s in sessions for x in s.turns]
+    first = [x for s in sessions for x in s.first_token]
+    pdf = [x for s in sessions for x in s.pdf_tasks]
+    return {
+        "name": "loadtest",
+        "params": {"users": n_users, "turns": args.turns, "stream": args.stream},
+        "elapsed": elapsed,
+        "turns": len(turns),
+        "errors": sum(s.errors for s in sessions),
+        "throughput_turns_per_s": len(turns) / elapsed if elapsed else 0.0,
+        "turn_p50": percentile(turns, 0.50),
+        "turn_p95": percentile(turns, 0.95),
+        "turn_p99": percentile(turns, 0.99),
+        "first_token_p50": percentile(first, 0.50),
+        "pdf_tasks": len(pdf),
+        "pdf_task_p50": percentile(pdf, 0.50),
+        "rss_before_mb": rss_before / 2**20,
+        "rss_peak_mb": peak / 2**20,
+        "rss_per_session_kb": (peak - rss_before) / n_users / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EduBot concurrent-session load test")
+    parser.add_argument("--users", default="1,5,10,25", help="comma-separated concurrency levels")
+    parser.add_argument("--turns", type=int, default=5, help="chat turns per session")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean pause between turns (s)")
+    parser.add_argument("--history", type=int, default=40, help="messages already in each user's history")
+    parser.add_argument("--pdf-every", type=int, default=0, help="1 in N sessions also runs a PDF summary (0 = none)")
+    parser.add_argument("--pdf-pages", type=int, default=20)
+    parser.add_argument("--signup", action="store_true", help="sign users up instead of logging in")
+    parser.add_argument("--no-stream", dest="stream", action="store_false", help="blocking replies instead of SSE")
+    parser.add_argument("--latency", type=float, default=0.3, help="fake server time to first byte (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0, help="fake server streaming rate")
+    parser.add_argument("--fast-auth", action="store_true",
+                        help=f"bcrypt cost {FAST_AUTH_ROUNDS} instead of the app's; login cost is then not representative")
+    parser.add_argument("--out", help="write JSON results to this file instead of stdout")
+    args = parser.parse_args()
+
+    if args.fast_auth:
+        os.environ["EDUBOT_BCRYPT_ROUNDS"] = str(FAST_AUTH_ROUNDS)
+    from utils.auth_service import BCRYPT_ROUNDS
+    levels = [int(n) for n in args.users.split(",")]
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "latency": args.latency,
+            "tokens_per_second": args.tokens_per_second,
+            "bcrypt_rounds": BCRYPT_ROUNDS,
+            "fast_auth": args.fast_auth,
+        },
+        "results": [],
+    }
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="edubot-load-") as workdir, \
+            FakeOpenRouter(latency=args.latency, tokens_per_second=args.tokens_per_second) as server:
+        os.chdir(workdir)  # users/history files are cwd-relative
+        os.environ["OPENROUTER_BASE_URL"] = server.base_url
+        try:
+            from benchmarks.datagen import make_users
+            from utils.auth_service import hash_password
+            pdf_path = make_pdf(args.pdf_pages, os.path.abspath("load.pdf")) if args.pdf_every else None
+            if not args.signup:
+                make_users(0, "users.json")
+                from utils.user_store import get_user_store
+                store, hashed = get_user_store(), hash_password("load-test-pw")
+                store.save({"users": [
+                    {"email": f"load{level}_{i}@example.com", "username": f"load{level}_{i}", "password": hashed}
+                    for level, n in [("w", 1)] + list(enumerate(levels)) for i in range(n)
+                ]})
+            # One untimed session first, so lazy imports and the process pools
+            # are not charged to the first level's latency and RSS
+            run_level(1, "w", pdf_path, args)
+            for level, n in enumerate(levels):
+                print(f"{n} concurrent sessions…", file=sys.stderr)
+                result = run_level(n, level, pdf_path, args)
+                report["results"].append(result)
+                print(
+                    f"  {result['throughput_turns_per_s']:7.1f} turns/s  "
+                    f"p50 {result['turn_p50'] or 0:6.3f}s  p95 {result['turn_p95'] or 0:6.3f}s  "
+                    f"p99 {result['turn_p99'] or 0:6.3f}s  errors {result['errors']}  "
+                    f"RSS {result['rss_peak_mb']:.0f} MB ({result['rss_per_session_kb']:.0f} KB/session)",
+                    file=sys.stderr
+                )
+        finally:
+            os.chdir(cwd)
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
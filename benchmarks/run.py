@@ -0,0 +1,317 @@
+# benchmarks/run.py
+#
+#   python benchmarks/run.py                     # full suite, JSON on stdout
+#   python benchmarks/run.py --quick --out bench.json
+#   python benchmarks/run.py --only users,history --compare bench.json
+
+import argparse
+import ast
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from benchmarks.datagen import make_history, make_pdf, make_text, make_users  # noqa: E402
+from benchmarks.fake_openrouter import FakeOpenRouter  # noqa: E402
+
+BENCHMARKS = {}
+FAST_AUTH_ROUNDS = 4             # --fast-auth bcrypt cost (the app's default is 12)
+
+
+def benchmark(name):
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+
+def measure(name, fn, repeat=5, warmup=1, setup=None, **params):
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "name": name,
+        "params": params,
+        "runs": repeat,
+        "min": samples[0],
+        "p50": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "max": samples[-1],
+    }
+
+
+# ───── suites ─────
+@benchmark("users")
+def bench_users(quick):
+    from utils import auth_service
+    from utils.user_store import UserStore
+    results = []
+    for n in ([1000, 10000] if quick else [1000, 10000, 100000]):
+        path = os.path.abspath(f"users_{n}.json")
+        make_users(n, path)
+        store = UserStore(path)
+        store.load()
+        target = f"user{n - 1}"
+        results.append(measure("load_users.cold_parse", lambda: UserStore(path).load(), repeat=3, users=n))
+        results.append(measure("load_users.cached", store.load, repeat=200, users=n))
+        results.append(measure("user_lookup", lambda: store.get_by_username(target), repeat=200, users=n))
+        results.append(measure(
+            "check_user_credentials",
+            lambda: auth_service.authenticate(store, target, "benchmark-pw"),
+            repeat=10, users=n, bcrypt_rounds=auth_service.BCRYPT_ROUNDS
+        ))
+    return results
+
+
+@benchmark("history")
+def bench_history(quick):
+    from utils import history_store
+    from utils.history_search import search_history
+    results = []
+    for n in ([100, 1000] if quick else [100, 1000, 10000]):
+        user = f"bench{n}"
+        history = make_history(n)
+        turn = make_history(2, seed=n)
+
+        def reset():
+            history_store.clear_history(user)
+            history_store.append_history(user, *history)
+
+        reset()
+        results.append(measure("load_history", lambda: history_store.load_history(user), setup=reset, messages=n))
+
+        state = {}
+
+        def add_turn():
+            state["h"].extend(turn)
+            history_store.save_history(user, state["h"])
+
+        state["h"] = history_store.load_history(user)
+        results.append(measure("save_history.per_turn", add_turn, repeat=20, messages=n))
+        for query in ("gradient descent", "the"):
+            results.append(measure("history_search", lambda: search_history(user, query), repeat=50,
+                                   messages=n, query=query))
+        history_store.clear_history(user)
+    return results
+
+
+@benchmark("pdf")
+def bench_pdf(quick):
+    from utils import pdf_extract
+    results = []
+    for pages in ([50] if quick else [100, 300]):
+        path = make_pdf(pages, os.path.abspath(f"bench_{pages}.pdf"))
+        with open(path, "rb") as f:
+            data = f.read()
+        cache_dir = os.path.abspath("pdf_cache")
+
+        def cold():
+            pdf_extract.CACHE_DIR = os.path.join(cache_dir, str(time.perf_counter_ns()))
+
+        results.append(measure("pdf_extract.sequential", lambda: pdf_extract.extract_pages(data, parallel=False),
+                               repeat=2, pages=pages))
+        results.append(measure("pdf_extract.parallel_cold", lambda: pdf_extract.extract_pdf_text(data),
+                               repeat=2, setup=cold, pages=pages))
+        results.append(measure("pdf_extract.cached", lambda: pdf_extract.extract_pdf_text(data), repeat=50, pages=pages))
+        from utils.text_compact import compact_pages
+        page_texts = pdf_extract.get_pdf_pages(data)
+        saved = compact_pages(page_texts)[1]["tokens_saved"]
+        results.append(measure("text_compact", lambda: compact_pages(page_texts), repeat=5,
+                               pages=pages, tokens_saved=saved))
+        results.append(measure("pdf_extract.upload_stream_cold", lambda: _ingest_upload(path),
+                               repeat=2, setup=cold, pages=pages))
+        try:
+            pdf_extract.resolve_backend("pymupdf")
+        except ImportError:
+            continue
+        results.append(measure("pdf_extract.pymupdf_cold", lambda: pdf_extract.extract_pdf_text(data, "pymupdf"),
+                               repeat=3, setup=cold, pages=pages))
+    return results
+
+
+def _ingest_upload(path):
+    # The page's path: spool the upload object, extract into the store, read it back
+    from utils import pdf_extract
+    with open(path, "rb") as f:
+        doc = pdf_extract.open_pdf_upload(f)
+    return doc.text()
+
+
+@benchmark("qa")
+def bench_qa(quick):
+    from utils.qa_generator import generate_mcqs, generate_short_answers
+    results = []
+    for words in ([20000] if quick else [20000, 100000]):
+        text = make_text(words)
+        results.append(measure("generate_mcqs", lambda: generate_mcqs(text, seed=0), repeat=3, words=words))
+        results.append(measure("generate_short_answers", lambda: generate_short_answers(text), repeat=3, words=words))
+    return results
+
+
+@benchmark("chat_turn")
+def bench_chat_turn(quick):
+    from utils import history_store, llm_client
+    from utils.context_window import ContextWindow
+    results = []
+    with FakeOpenRouter(latency=0.0) as server:
+        os.environ["OPENROUTER_BASE_URL"] = server.base_url
+        for n in ([100] if quick else [100, 2000]):
+            user = f"turn{n}"
+            history_store.clear_history(user)
+            history_store.append_history(user, *make_history(n))
+            # What the page holds: the hot records and their save cursor
+            history = history_store.load_history(user)
+            window = ContextWindow()
+
+            def turn(stream):
+                history.append({"role": "user", "content": "Explain gradient descent again, briefly."})
+                messages = window.build(history)
+                if stream:
+                    reply = llm_client.collect_stream(messages)
+                else:
+                    reply = llm_client.ask_openrouter(messages)
+                history.append({"role": "assistant", "content": reply})
+                history_store.save_history(user, history)
+
+            results.append(measure("chat_turn.blocking", lambda: turn(False), repeat=20, history=n))
+            results.append(measure("chat_turn.streaming", lambda: turn(True), repeat=20, history=n))
+            history_store.clear_history(user)
+    return results
+
+
+@benchmark("startup")
+def bench_startup(quick):
+    # Cold-start import cost of each page: its module-level imports are run in
+    # a fresh interpreter under -X importtime. Packages that are not installed
+    # are skipped and listed under "missing".
+    results = []
+    for page in ("app.py", os.path.join("pages", "1_chatbot.py")):
+        statements = page_imports(os.path.join(ROOT, page))
+        profiles = [import_profile(statements) for _ in range(3 if quick else 7)]
+        totals = sorted(p["total"] for p in profiles)
+        results.append({
+            "name": "startup.imports",
+            "params": {"page": page},
+            "runs": len(totals),
+            "min": totals[0],
+            "p50": statistics.median(totals),
+            "mean": statistics.fmean(totals),
+            "max": totals[-1],
+            "top": profiles[-1]["top"],
+            "missing": profiles[-1]["missing"],
+        })
+    return results
+
+
+def page_imports(path):
+    with open(path) as f:
+        source = f.read()
+    return [ast.get_source_segment(source, node) for node in ast.parse(source).body
+            if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+
+def import_profile(statements, top=8):
+    code = "import sys\nsys.stderr.write('-- page imports --\\n')\n" + "\n".join(
+        f"try:\n    {stmt}\nexcept ImportError as e:\n    print(e.name)" for stmt in statements
+    )
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                          cwd=ROOT, capture_output=True, text=True)
+    # "import time: <self us> | <cumulative us> | <indented module name>"
+    # Interpreter startup (site, encodings, ...) comes before the marker
+    roots = []
+    _, _, page_part = proc.stderr.partition("-- page imports --\n")
+    for line in page_part.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name[1:].startswith(" "):  # top-level import, not a nested one
+            roots.append((int(cumulative) / 1e6, name.strip()))
+    roots.sort(reverse=True)
+    return {
+        "total": sum(seconds for seconds, _ in roots),
+        "top": [{"module": name, "seconds": seconds} for seconds, name in roots[:top]],
+        "missing": sorted(set(proc.stdout.split())),
+    }
+
+
+# ───── driver ─────
+def compare(current, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    key = lambda r: (r["name"], json.dumps(r["params"], sort_keys=True))  # noqa: E731
+    before = {key(r): r for r in baseline["results"]}
+    lines = []
+    for r in current["results"]:
+        old = before.get(key(r))
+        if old:
+            ratio = r["p50"] / old["p50"] if old["p50"] else float("inf")
+            flag = "  REGRESSION" if ratio > 1.2 else ""
+            lines.append(f"{r['name']:<32} {json.dumps(r['params']):<22} {old['p50'] * 1e3:10.3f} ms -> {r['p50'] * 1e3:10.3f} ms  x{ratio:.2f}{flag}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EduBot hot-path benchmarks")
+    parser.add_argument("--only", help="comma-separated suites: " + ",".join(BENCHMARKS))
+    parser.add_argument("--quick", action="store_true", help="smaller sizes for a fast smoke run")
+    parser.add_argument("--out", help="write JSON results to this file instead of stdout")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run to diff against")
+    parser.add_argument("--fast-auth", action="store_true",
+                        help=f"bcrypt cost {FAST_AUTH_ROUNDS} instead of the app's; login timings are then not representative")
+    args = parser.parse_args()
+
+    if args.fast_auth:
+        os.environ["EDUBOT_BCRYPT_ROUNDS"] = str(FAST_AUTH_ROUNDS)
+    from utils.auth_service import BCRYPT_ROUNDS
+    suites = args.only.split(",") if args.only else list(BENCHMARKS)
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "quick": args.quick,
+            "bcrypt_rounds": BCRYPT_ROUNDS,
+            "fast_auth": args.fast_auth,
+        },
+        "results": [],
+    }
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="edubot-bench-") as workdir:
+        os.chdir(workdir)  # history/users files are cwd-relative
+        try:
+            for suite in suites:
+                print(f"running {suite}…", file=sys.stderr)
+                report["results"].extend(BENCHMARKS[suite](args.quick))
+        finally:
+            os.chdir(cwd)
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    if args.compare:
+        print(compare(report, args.compare), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
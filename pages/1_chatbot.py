@@ -1,21 +1,22 @@
 import streamlit as st
-import requests
-import json
-from PyPDF2 import PdfReader
-import pdfplumber
-import os
 from streamlit_js_eval import streamlit_js_eval
+from utils import metrics
+from utils.llm_client import LLMError
+from utils.model_router import get_model_router
+from utils.session_store import SESSION_COOKIE, get_session_store, session_user
+from utils.history_store import History, archived_before, clear_history, load_archived, load_history, save_history
+from utils.history_search import search_history
+from utils.pdf_extract import open_pdf_upload
+from utils.text_compact import compaction_stats
+from utils.pdf_tasks import chat_cache_context, ground_in_pdf, run_pdf_task
+from utils.context_window import ContextWindow, llm_summarizer
+from utils.response_cache import get_response_cache
+from utils.transcript import TranscriptRenderer, message_html
+from utils.jobs import JobLimitReached, get_job_runner
 
 st.set_page_config(page_title="EduyyBot", page_icon="📘", layout="wide")
 
-COOKIE_KEY = "eduyy_user"
-
-def get_cookie(key):
-    cookies = streamlit_js_eval(js_code="document.cookie", key="get_cookie_chat")
-    if cookies:
-        cookies = dict(c.split("=", 1) for c in cookies.split("; ") if "=" in c)
-        return cookies.get(key)
-    return None
+metrics.start_exporter()
 
 def delete_cookie(key):
     streamlit_js_eval(
@@ -23,13 +24,6 @@ def delete_cookie(key):
         key="delete_cookie_chat"
     )
 
-def load_users_local():
-    try:
-        with open('users.json', 'r') as file:
-            return json.load(file)
-    except FileNotFoundError:
-        return {"users": []}
-
 # ───── AUTH CHECK ─────
 if "is_logged_in" not in st.session_state:
     st.session_state["is_logged_in"] = False
@@ -40,17 +34,17 @@ if "logged_once" not in st.session_state:
 if st.session_state["logged_once"] and not st.session_state["is_logged_in"]:
     st.session_state["is_logged_in"] = True
 
-# Restore login from cookie (survives a hard browser refresh, which reloads
-# this page directly without going through app.py)
+# Restore login from the session cookie (survives a hard browser refresh,
+# which reloads this page directly without going through app.py)
 if not st.session_state["is_logged_in"]:
-    cookie_user = get_cookie(COOKIE_KEY)
+    with metrics.span("cookie_restore"):
+        cookie_user = session_user(st.context.cookies)
     if cookie_user:
-        users = load_users_local()
-        if any(u["username"] == cookie_user for u in users["users"]):
-            st.session_state["is_logged_in"] = True
-            st.session_state["logged_once"] = True
-            st.session_state["username"] = cookie_user
-            st.rerun()
+        st.session_state["is_logged_in"] = True
+        st.session_state["logged_once"] = True
+        st.session_state["username"] = cookie_user
+        st.session_state["session_token"] = st.context.cookies.get(SESSION_COOKIE)
+        st.rerun()
 
 # If still not logged in, block
 if not st.session_state["is_logged_in"]:
@@ -59,27 +53,33 @@ if not st.session_state["is_logged_in"]:
 
 username = st.session_state.get("username", "Guest")
 
-# ───── FUNCTIONS: HISTORY ─────
-def load_history(username):
-    filename = f"history_{username}.json"
-    if os.path.exists(filename):
-        with open(filename, "r") as f:
-            return json.load(f)
-    return []
-
-def save_history(username, history):
-    filename = f"history_{username}.json"
-    with open(filename, "w") as f:
-        json.dump(history, f)
-
-def clear_history(username):
-    filename = f"history_{username}.json"
-    if os.path.exists(filename):
-        os.remove(filename)
-
 # ───── LOAD PERMANENT HISTORY INTO SESSION ─────
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = load_history(username)
+    # Older messages stay in the compressed archive until the user scrolls back
+    st.session_state.archive_start = st.session_state.chat_history.start
+    st.session_state.archived_blocks = []
+
+# What actually goes to the LLM: recent turns + a rolling summary, within a token budget
+if "context_window" not in st.session_state:
+    st.session_state.context_window = ContextWindow(summarize=llm_summarizer(get_model_router().asker("chat")))
+if "transcript" not in st.session_state:
+    st.session_state.transcript = TranscriptRenderer()
+
+# ───── COLLECT FINISHED PDF JOBS ─────
+# Jobs run off the script thread; their results are appended here so the
+# session's chat_history remains the single writer of the history file.
+job_runner = get_job_runner()
+for job in job_runner.claim_finished(username):
+    if job["state"] == "done":
+        reply, note = job["result"]
+        st.session_state.chat_history.append({"role": "user", "content": job["label"]})
+        st.session_state.chat_history.append({"role": "assistant", "content": reply})
+        save_history(username, st.session_state.chat_history)
+        if note:
+            st.toast(note)
+    else:
+        st.toast(f"❌ {job['label']} failed: {job['error']}")
 
 if "clear_flag" in st.session_state and st.session_state.clear_flag:
     st.session_state.current_input = ""
@@ -305,39 +305,93 @@ with st.sidebar:
 
     if st.button("🗑️  Clear chat"):
         clear_history(username)
-        st.session_state.chat_history = []
+        st.session_state.chat_history = History()
+        st.session_state.archive_start = 0
+        st.session_state.archived_blocks = []
+        st.session_state.context_window.reset()
+        st.session_state.transcript.reset()
         st.rerun()
 
+    stream_replies = st.toggle("⚡ Stream replies", value=True, help="Show the answer token-by-token as it is generated")
+
+    st.markdown("---")
+    search_query = st.text_input("🔎 Search past chats", placeholder="e.g. photosynthesis")
+    if search_query.strip():
+        results = search_history(username, search_query)
+        if not results:
+            st.caption("No matches.")
+        for hit in results:
+            who = "You" if hit["role"] == "user" else "EduBot"
+            with st.expander(f"{who} · message {hit['position'] + 1}"):
+                st.markdown(hit["snippet"])
+                st.caption(f"Full message ({len(hit['content'].split())} words):")
+                st.markdown(hit["content"])
+
     st.markdown("---")
     st.markdown("**📄 Upload a PDF**")
     uploaded_file = st.file_uploader("PDF", type=["pdf"], label_visibility="collapsed")
 
     pdf_action = None
-    run_pdf_task = False
+    run_pdf_clicked = False
+    use_pdf_for_chat = False
+    offline_questions = False
     if uploaded_file:
         try:
-            text = ""
-            with pdfplumber.open(uploaded_file) as pdf:
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-            st.session_state.pdf_text = text
-            st.success("PDF loaded ✓")
+            # The upload is spooled to disk and extracted page by page into the
+            # document store; the session keeps only the handle. Reruns reuse
+            # it unless the store evicted the document in the meantime.
+            doc = st.session_state.get("pdf_doc")
+            if st.session_state.get("pdf_upload_id") != uploaded_file.file_id or doc is None or not doc.exists():
+                with st.spinner("Reading PDF…"):
+                    st.session_state.pdf_doc = open_pdf_upload(uploaded_file)
+                    # headers/footers, page numbers, hyphenation and wrapping
+                    # are cleaned up once here, before any prompt is built
+                    st.session_state.pdf_compaction = compaction_stats(st.session_state.pdf_doc)
+                st.session_state.pdf_upload_id = uploaded_file.file_id
+            st.success(f"PDF loaded ✓ ({len(st.session_state.pdf_doc)} pages)")
+            compaction = st.session_state.get("pdf_compaction")
+            if compaction and compaction["tokens_saved"]:
+                share = compaction["tokens_saved"] / max(1, compaction["tokens_before"])
+                st.caption(f"Text cleanup saves ~{compaction['tokens_saved']:,} tokens ({share:.0%}) per PDF prompt")
 
             pdf_action = st.radio("What should I do with it?", ("Summarize", "Generate Questions"))
-            run_pdf_task = st.button("Run PDF task")
+            if pdf_action == "Generate Questions":
+                offline_questions = st.toggle("⚡ Offline mode (instant, no AI)", help="Build MCQs and short-answer questions locally from the PDF text")
+            run_pdf_clicked = st.button("Run PDF task")
+            use_pdf_for_chat = st.toggle("Answer chat questions from this PDF", value=True)
         except Exception as e:
             st.error(f"Failed to read PDF: {e}")
-            st.session_state.pdf_text = ""
+            for key in ("pdf_doc", "pdf_upload_id", "pdf_compaction"):
+                st.session_state.pop(key, None)
+
+    # Polls only while this user has jobs; a finished job triggers a full
+    # rerun so the block above can claim it into the chat.
+    @st.fragment(run_every=2 if job_runner.jobs(username) else None)
+    def job_panel():
+        jobs = job_runner.jobs(username)
+        if job_runner.has_finished(username):
+            st.rerun()
+        for job in jobs:
+            if job["state"] == "queued":
+                st.progress(0.0, text=f"{job['label']} · queued")
+            else:
+                fraction = job["done"] / job["total"] if job["total"] else 0.0
+                parts = f" ({job['done']}/{job['total']} parts)" if job["total"] else ""
+                st.progress(fraction, text=f"{job['label']} · running{parts}")
+
+    job_panel()
 
     st.markdown("---")
     if st.button("Log Out"):
-        delete_cookie(COOKIE_KEY)
+        get_session_store().revoke(st.session_state.pop("session_token", None)
+                                   or st.context.cookies.get(SESSION_COOKIE))
+        delete_cookie(SESSION_COOKIE)
         st.session_state["is_logged_in"] = False
         st.session_state["logged_once"] = False
         st.session_state["username"] = ""
-        st.session_state["chat_history"] = []
+        # Dropped, not emptied, so the next login loads that user's history
+        for key in ("chat_history", "archive_start", "archived_blocks", "context_window", "transcript"):
+            st.session_state.pop(key, None)
         js = """
         <script>
             window.location.href = "/";
@@ -359,56 +413,61 @@ with chat_container:
             unsafe_allow_html=True
         )
     else:
-        for chat in st.session_state.chat_history:
-            role = chat["role"]
-            msg = chat["content"]
-            cls = "user" if role == "user" else "bot"
-            label = "You" if role == "user" else "EduBot"
-            st.markdown(
-                f"""<div class='chat-row {cls}'>
-                        <div class='chat-role'>{label}</div>
-                        <div class='chat-content'>{msg}</div>
-                    </div>""",
-                unsafe_allow_html=True
-            )
+        # Only the most recent pages are rendered, in cached blocks
+        transcript = st.session_state.transcript
+        hidden = transcript.visible_start(len(st.session_state.chat_history))
+        if hidden and st.button(f"⬆ Load earlier messages ({hidden} hidden)", key="load_earlier"):
+            transcript.load_earlier()
+            st.rerun()
+        archived = 0 if hidden else archived_before(username, st.session_state.archive_start)
+        if archived and st.button(f"⬆ Load archived messages ({archived} older)", key="load_archived"):
+            start, records = load_archived(username, st.session_state.archive_start)
+            st.session_state.archive_start = start
+            st.session_state.archived_blocks.insert(0, "".join(message_html(m["role"], m["content"]) for m in records))
+            st.rerun()
+        if not hidden:
+            for block in st.session_state.archived_blocks:
+                st.markdown(block, unsafe_allow_html=True)
+        for block in transcript.render_blocks(st.session_state.chat_history):
+            st.markdown(block, unsafe_allow_html=True)
 
 # ═══════════════════════════ NLP CALL SETUP ═══════════════════════════
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-
-def ask_openrouter(messages):
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-        "HTTP-Referer": "https://streamlit.app",
-        "X-Title": "EduyyBot"
-    }
-    payload = {"model": "openrouter/free", "messages": messages}
-    try:
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=60
-        )
-        response.raise_for_status()
-        data = response.json()
-        return data["choices"][0]["message"]["content"].strip()
-    except Exception as e:
-        return f"❌ Error: {e}"
+response_cache = get_response_cache()
+# Short chat turns go to the fastest healthy model, PDF tasks to the longest-context one
+model_router = get_model_router()
+
+def get_reply(messages, spinner_text, shown_user_msg=None):
+    # Streaming mode renders tokens in the chat area as they arrive; either way
+    # the fully assembled reply is returned for chat_history / save_history.
+    # Failures raise LLMError so they never end up in the saved history.
+    if not stream_replies:
+        with st.spinner(spinner_text):
+            return model_router.ask(messages)
+    with chat_container:
+        if shown_user_msg:
+            st.markdown(message_html("user", shown_user_msg), unsafe_allow_html=True)
+        placeholder = st.empty()
+    placeholder.markdown(message_html("assistant", "▍"), unsafe_allow_html=True)
+    return model_router.collect_stream(
+        messages,
+        on_delta=lambda partial: placeholder.markdown(message_html("assistant", partial + "▍"), unsafe_allow_html=True)
+    )
 
 # ═══════════════════════════ PDF TASK HANDLING (triggered from sidebar) ═══════════════════════════
-if uploaded_file and pdf_action and run_pdf_task:
-    if pdf_action == "Summarize":
-        prompt = f"Summarize the following text:\n{st.session_state.pdf_text}"
-    else:
-        prompt = f"Generate interview/exam-style questions from the following text:\n{st.session_state.pdf_text}"
+if uploaded_file and pdf_action and run_pdf_clicked:
+    # The work runs as a background job; the sidebar shows its progress meanwhile.
+    pdf_doc, action, offline = st.session_state.pdf_doc, pdf_action, offline_questions
+
+    def run_pdf_job(progress):
+        # Runs on a job thread: no st.* calls, only the values captured above
+        return run_pdf_task(pdf_doc, action, model_router.asker("long"), offline, progress)
 
-    st.session_state.chat_history.append({"role": "user", "content": f"PDF Task: {pdf_action}"})
-    with st.spinner("EduBot is reading your PDF…"):
-        reply = ask_openrouter(st.session_state.chat_history + [{"role": "user", "content": prompt}])
-    st.session_state.chat_history.append({"role": "assistant", "content": reply})
-    save_history(username, st.session_state.chat_history)
-    st.rerun()
+    try:
+        job_runner.submit(username, f"PDF Task: {pdf_action}", run_pdf_job)
+    except JobLimitReached as e:
+        st.warning(str(e))
+    else:
+        st.rerun()
 
 # ═══════════════════════════ FLOATING INPUT BAR ═══════════════════════════
 st.markdown("<div style='height: 100px;'></div>", unsafe_allow_html=True)  # spacer so last message isn't hidden
@@ -428,15 +487,28 @@ with send_col:
 
 if send_clicked and st.session_state.current_input:
     user_message = st.session_state.current_input
+    grounded = uploaded_file and use_pdf_for_chat and st.session_state.get("pdf_doc")
+    pdf_doc = st.session_state.pdf_doc if grounded else None
+    cache_context = chat_cache_context(st.session_state.chat_history, pdf_doc)
     st.session_state.chat_history.append({"role": "user", "content": user_message})
 
-    with st.spinner("EduBot is thinking…"):
-        reply = ask_openrouter(st.session_state.chat_history)
-    st.session_state.chat_history.append({"role": "assistant", "content": reply})
-
-    save_history(username, st.session_state.chat_history)
-    st.session_state.clear_flag = True
-    st.rerun()
+    try:
+        reply = response_cache.get(user_message, cache_context)
+        if reply is None:
+            messages = st.session_state.context_window.build(st.session_state.chat_history)
+            if pdf_doc is not None:
+                messages = ground_in_pdf(messages, pdf_doc, user_message)
+            reply = get_reply(messages, "EduBot is thinking…", shown_user_msg=user_message)
+            response_cache.put(user_message, reply, cache_context)
+    except LLMError as e:
+        # Drop the unanswered message and keep it in the input box for a retry
+        st.session_state.chat_history.pop()
+        st.error(f"❌ {e}")
+    else:
+        st.session_state.chat_history.append({"role": "assistant", "content": reply})
+        save_history(username, st.session_state.chat_history)
+        st.session_state.clear_flag = True
+        st.rerun()
 
 # ───── AUTO-SCROLL TO BOTTOM ─────
 st.markdown("""
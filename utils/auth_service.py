@@ -0,0 +1,172 @@
+# utils/auth_service.py
+
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.getenv("EDUBOT_BCRYPT_ROUNDS", 12))
+AUTH_WORKERS = int(os.getenv("EDUBOT_AUTH_WORKERS", 2))
+MAX_PENDING = AUTH_WORKERS * 8     # queued hash jobs before new ones are refused
+PENDING_WAIT = 5.0                 # seconds to wait for a free slot
+
+USER_MAX_FAILURES = 5              # failed logins per username...
+USER_WINDOW = 15 * 60              # ...within this many seconds
+IP_MAX_FAILURES = 20               # failed logins per client IP...
+IP_WINDOW = 5 * 60                 # ...within this many seconds
+LIMITER_MAX_KEYS = 100_000         # tracked usernames/IPs per limiter
+
+
+class AuthError(Exception):
+    pass
+
+
+class LoginThrottled(AuthError):
+    def __init__(self, retry_after):
+        super().__init__(f"Too many login attempts. Try again in {int(retry_after) + 1} s.")
+        self.retry_after = retry_after
+
+
+class AuthBusy(AuthError):
+    pass
+
+
+# ───── bcrypt in a bounded process pool ─────
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds)).decode()
+
+
+def _checkpw(password, hashed):
+    return bcrypt.checkpw(password.encode(), hashed.encode())
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(MAX_PENDING)
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=AUTH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def _run(fn, *args):
+    # At most MAX_PENDING hashes are queued; past that the caller gets AuthBusy
+    # instead of piling more CPU work onto the pool.
+    if not _slots.acquire(timeout=PENDING_WAIT):
+        raise AuthBusy("The server is busy. Please try again in a moment.")
+    try:
+        return _get_pool().submit(fn, *args).result()
+    finally:
+        _slots.release()
+
+
+def hash_password(password, rounds=None):
+    return _run(_hashpw, password, rounds or BCRYPT_ROUNDS)
+
+
+def verify_password(password, hashed):
+    return _run(_checkpw, password, hashed)
+
+
+@lru_cache(maxsize=1)
+def _dummy_hash():
+    # Checked for unknown usernames so a miss costs the same as a wrong password
+    return hash_password("edubot-dummy-password")
+
+
+def hash_rounds(hashed):
+    try:
+        return int(hashed.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+# ───── attempt throttling ─────
+class SlidingWindowLimiter:
+    def __init__(self, limit, window, max_keys=LIMITER_MAX_KEYS):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._events = {}
+        self._lock = threading.Lock()
+
+    def _prune(self, key, now):
+        events = self._events.get(key)
+        if events is None:
+            return None
+        while events and now - events[0] > self.window:
+            events.popleft()
+        if not events:
+            del self._events[key]
+            return None
+        return events
+
+    def retry_after(self, key):
+        now = time.monotonic()
+        with self._lock:
+            events = self._prune(key, now)
+            if events is None or len(events) < self.limit:
+                return 0.0
+            return self.window - (now - events[0])
+
+    def hit(self, key):
+        now = time.monotonic()
+        with self._lock:
+            self._prune(key, now)
+            if key not in self._events and len(self._events) >= self.max_keys:
+                self._evict(now)
+            self._events.setdefault(key, deque()).append(now)
+
+    def _evict(self, now):
+        # Caller holds the lock. Expired keys go first; if made-up usernames
+        # or addresses still fill the table, the least recently added go.
+        for key in list(self._events):
+            self._prune(key, now)
+        excess = len(self._events) - self.max_keys + 1
+        for key in list(self._events)[:max(0, excess)]:
+            del self._events[key]
+
+    def reset(self, key):
+        with self._lock:
+            self._events.pop(key, None)
+
+
+user_failures = SlidingWindowLimiter(USER_MAX_FAILURES, USER_WINDOW)
+ip_failures = SlidingWindowLimiter(IP_MAX_FAILURES, IP_WINDOW)
+
+
+def authenticate(user_store, username, password, ip=None):
+    # Throttle checks come first, so throttled attempts cost no bcrypt work.
+    # Only failures count, also per IP: a campus NAT or proxy address sees
+    # many successful logins, and those must not lock its students out. A
+    # success does not clear the IP's window either, or an attacker could
+    # reset it with their own account.
+    wait = max(user_failures.retry_after(username), ip_failures.retry_after(ip) if ip else 0.0)
+    if wait > 0:
+        raise LoginThrottled(wait)
+
+    user = user_store.get_by_username(username)
+    ok = verify_password(password, user["password"] if user else _dummy_hash()) and user is not None
+    if not ok:
+        user_failures.hit(username)
+        if ip:
+            ip_failures.hit(ip)
+        return False
+
+    user_failures.reset(username)
+    # Transparently upgrade hashes made with a lower cost factor
+    if (hash_rounds(user["password"]) or 0) < BCRYPT_ROUNDS:
+        user_store.update_user(username, password=hash_password(password))
+    return True
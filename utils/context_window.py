@@ -0,0 +1,104 @@
+# utils/context_window.py
+
+import os
+
+from utils.llm_client import LLMError
+from utils.tokens import estimate_message_tokens, estimate_tokens, tokens_to_chars
+
+CONTEXT_BUDGET_TOKENS = int(os.getenv("EDUBOT_CONTEXT_TOKENS", 6000))
+SUMMARY_TOKENS = 600        # cap on the rolling summary of older turns
+SUMMARY_SOURCE_TOKENS = 3000  # most of the evicted span fed into one summary update
+REFILL_RATIO = 0.5          # after trimming, recent turns use at most this share
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a tutoring conversation between a student and EduBot.\n"
+    "Current summary:\n{summary}\n\n"
+    "New turns to fold in:\n{turns}\n\n"
+    "Return the updated summary in at most {words} words. Keep topics, facts the student "
+    "shared and open questions."
+)
+
+
+class ContextWindow:
+    # Builds the message list sent to the LLM from the full chat history:
+    # a rolling window of recent turns plus a summary of everything older,
+    # kept under a token budget. The history itself is never modified.
+    #
+    # Per-message token counts are cached as prefix sums and extended
+    # incrementally, and the summary is only refreshed when the window
+    # overflows (then trimmed to REFILL_RATIO), not on every turn.
+
+    def __init__(self, budget=CONTEXT_BUDGET_TOKENS, summarize=None):
+        self.budget = budget
+        self.summarize = summarize  # summarize(summary, turns) -> str, or None to just drop
+        self.summary = ""
+        self.start = 0              # first history index still sent verbatim
+        self._prefix = [0]          # _prefix[i] = tokens of history[:i]
+
+    def reset(self):
+        self.summary = ""
+        self.start = 0
+        self._prefix = [0]
+
+    def _update_counts(self, history):
+        if len(history) < len(self._prefix) - 1:
+            self.reset()  # history was cleared or replaced
+        for message in history[len(self._prefix) - 1:]:
+            self._prefix.append(self._prefix[-1] + estimate_message_tokens(message))
+
+    def _span_tokens(self, start, stop):
+        return self._prefix[stop] - self._prefix[start]
+
+    def _summary_message(self):
+        return {"role": "system", "content": f"Summary of the earlier conversation:\n{self.summary}"}
+
+    def build(self, history):
+        self._update_counts(history)
+        end = len(history)
+        summary_tokens = estimate_tokens(self.summary)
+        if summary_tokens + self._span_tokens(self.start, end) > self.budget:
+            self._trim(history, end)
+        messages = list(history[self.start:])
+        if self.summary:
+            messages.insert(0, self._summary_message())
+        return messages
+
+    def _trim(self, history, end):
+        target = int(self.budget * REFILL_RATIO) - SUMMARY_TOKENS
+        new_start = end - 1  # the latest message is always sent
+        while new_start > self.start and self._span_tokens(new_start - 1, end) <= target:
+            new_start -= 1
+        if self.summarize:
+            # Only the most recent part of a very long evicted span is folded in.
+            source_start = new_start
+            while source_start > self.start and self._span_tokens(source_start - 1, new_start) <= SUMMARY_SOURCE_TOKENS:
+                source_start -= 1
+            try:
+                updated = self.summarize(self.summary, history[source_start:new_start])
+            except LLMError:
+                updated = None  # keep the old summary; those turns are just dropped
+            if updated:
+                self.summary = updated[:tokens_to_chars(SUMMARY_TOKENS)]
+        self.start = new_start
+
+    def stats(self, history):
+        self._update_counts(history)
+        return {
+            "history_messages": len(history),
+            "window_messages": len(history) - self.start,
+            "window_tokens": self._span_tokens(self.start, len(history)) + estimate_tokens(self.summary),
+            "history_tokens": self._prefix[-1],
+        }
+
+
+def llm_summarizer(ask):
+    # Adapts a chat-completions call (ask_openrouter) into a summarize() hook.
+    def summarize(summary, turns):
+        transcript = "\n".join(f"{m['role']}: {m['content']}" for m in turns)
+        prompt = SUMMARY_PROMPT.format(
+            summary=summary or "(none yet)",
+            turns=transcript,
+            words=int(SUMMARY_TOKENS * 0.75)
+        )
+        return ask([{"role": "user", "content": prompt}])
+    return summarize
@@ -0,0 +1,200 @@
+# utils/history_search.py
+
+import os
+import re
+import threading
+
+from utils import metrics
+
+# Full-text index over every user's chat history, in an SQLite FTS5 table.
+# save_history feeds it the records it appends, so indexing a turn costs one
+# small transaction and a search never reads the history file. The index is
+# derived data: it lives in the cache directory, and when its record count
+# for a user disagrees with the history (first run, a rewrite, a deleted
+# database) that user's history, archive included, is indexed again.
+SEARCH_DB = os.getenv("EDUBOT_SEARCH_DB") or os.path.join(os.getenv("EDUBOT_CACHE_DIR", ".cache"), "history_search.db")
+SCHEMA_VERSION = 2
+SNIPPET_TOKENS = 16          # words of context around the matches
+MAX_RESULTS = 20
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _match_query(query, operator):
+    # User input is never passed to FTS5 as syntax: every word is quoted, and
+    # the last one is a prefix so results update while the user is typing.
+    terms = [f'"{t}"' for t in _TERM_RE.findall(query.lower())]
+    if not terms:
+        return None
+    terms[-1] += "*"
+    return "content : (" + f" {operator} ".join(terms) + ")"
+
+
+def _owner_query(owner_id):
+    # Each row carries its owner as a synthetic token ("u<id>" from the owners
+    # table), so a search only walks that user's postings. Usernames never go
+    # through the tokenizer, which would drop punctuation-only ones entirely.
+    return f'owner : "u{owner_id}"'
+
+
+class HistorySearch:
+    def __init__(self, path=SEARCH_DB):
+        import sqlite3
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        if self._db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            # Derived data: an index in an older layout is simply rebuilt
+            for table in ("messages", "indexed", "owners"):
+                self._db.execute(f"DROP TABLE IF EXISTS {table}")
+            self._db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self._db.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5("
+            "content, owner, role UNINDEXED, position UNINDEXED, "
+            "tokenize = 'porter unicode61')"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS owners (id INTEGER PRIMARY KEY, username TEXT UNIQUE)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS indexed (username TEXT PRIMARY KEY, records INTEGER)")
+        self._db.commit()
+
+    # ───── indexing ─────
+    def _owner(self, username, create=False):
+        row = self._db.execute("SELECT id FROM owners WHERE username = ?", (username,)).fetchone()
+        if row is None and create:
+            return self._db.execute("INSERT INTO owners (username) VALUES (?)", (username,)).lastrowid
+        return row[0] if row else None
+
+    def _delete_user(self, username, before=None):
+        owner_id = self._owner(username)
+        if owner_id is None:
+            return
+        sql = "DELETE FROM messages WHERE rowid IN (SELECT rowid FROM messages WHERE messages MATCH ?"
+        args = [_owner_query(owner_id)]
+        if before is not None:
+            sql += " AND position < ?"
+            args.append(before)
+        self._db.execute(sql + ")", args)
+
+    def _indexed(self, username):
+        row = self._db.execute("SELECT records FROM indexed WHERE username = ?", (username,)).fetchone()
+        return row[0] if row else None
+
+    def sync(self, username, records, position):
+        # records: what save_history just appended, records[0] at `position`
+        # in the conversation. Anything but a clean continuation rebuilds.
+        with self._lock:
+            current = self._indexed(username)
+        if current != position:
+            self.rebuild(username)
+            return
+        with self._lock, metrics.span("search_index"), self._db:
+            self._insert(username, enumerate(records, position))
+            self._db.execute("INSERT OR REPLACE INTO indexed (username, records) VALUES (?, ?)",
+                             (username, position + len(records)))
+
+    def rebuild(self, username):
+        # Reads the whole stored history, archive included, outside our lock
+        # (history_store calls in here holding its own)
+        from utils.history_store import iter_history
+        end, records = iter_history(username)
+        with self._lock, metrics.span("search_rebuild"), self._db:
+            self._delete_user(username)
+            self._insert(username, records)
+            self._db.execute("INSERT OR REPLACE INTO indexed (username, records) VALUES (?, ?)", (username, end))
+
+    def _insert(self, username, numbered):
+        owner = f"u{self._owner(username, create=True)}"
+        self._db.executemany(
+            "INSERT INTO messages (content, owner, role, position) VALUES (?, ?, ?, ?)",
+            ((m.get("content", ""), owner, m.get("role", ""), i)
+             for i, m in numbered if isinstance(m.get("content"), str))
+        )
+
+    def ensure(self, username):
+        # Catches up a user whose history predates the index
+        with self._lock:
+            if self._indexed(username) is not None:
+                return
+        self.rebuild(username)
+
+    def drop_before(self, username, position):
+        # Archive chunks deleted by the history quota
+        with self._lock, self._db:
+            self._delete_user(username, before=position)
+
+    def forget(self, username):
+        with self._lock, self._db:
+            self._delete_user(username)
+            self._db.execute("DELETE FROM indexed WHERE username = ?", (username,))
+
+    # ───── queries ─────
+    @metrics.timed("history_search")
+    def search(self, username, query, limit=MAX_RESULTS):
+        # Best matches first (BM25). Every word has to match; if nothing does,
+        # any word will do. Returns dicts with position, role, snippet, content.
+        for operator in ("AND", "OR"):
+            match = _match_query(query, operator)
+            if match is None:
+                return []
+            with self._lock:
+                owner_id = self._owner(username)
+                if owner_id is None:
+                    return []
+                rows = self._db.execute(
+                    "SELECT position, role, snippet(messages, 0, '**', '**', '…', ?), content "
+                    "FROM messages WHERE messages MATCH ? "
+                    "ORDER BY bm25(messages, 1.0, 0.0) LIMIT ?",
+                    (SNIPPET_TOKENS, f"{_owner_query(owner_id)} AND {match}", limit)
+                ).fetchall()
+            if rows:
+                break
+        return [{"position": int(p), "role": r, "snippet": s, "content": c} for p, r, s, c in rows]
+
+
+_search = None
+_search_lock = threading.Lock()
+
+
+def get_history_search():
+    global _search
+    with _search_lock:
+        if _search is None:
+            _search = HistorySearch()
+        return _search
+
+
+def search_history(username, query, limit=MAX_RESULTS):
+    search = get_history_search()
+    search.ensure(username)
+    return search.search(username, query, limit)
+
+
+# ───── hooks called by history_store ─────
+# A broken index must never cost the user their turn, so failures are only
+# counted.
+def _guarded(method, *args):
+    import sqlite3
+    try:
+        getattr(get_history_search(), method)(*args)
+    except sqlite3.Error:
+        metrics.inc("errors_total", where="search_index", type="sqlite3.Error")
+
+
+def index_history(username, records, position):
+    _guarded("sync", username, records, position)
+
+
+def reindex_history(username):
+    _guarded("rebuild", username)
+
+
+def drop_indexed(username, position):
+    _guarded("drop_before", username, position)
+
+
+def forget_history(username):
+    _guarded("forget", username)
@@ -0,0 +1,406 @@
+# utils/history_store.py
+
+import atexit
+import contextlib
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; threads are still serialized there
+    fcntl = None
+
+from utils import metrics
+from utils.history_search import drop_indexed, forget_history, index_history, reindex_history
+
+# One JSON record per line, appended per turn. A crash can at worst leave a
+# torn final line, which load_history drops and repairs before the next append.
+#
+# Only the recent end of a conversation lives in that file ("hot"). Once it
+# holds HOT_LIMIT messages, all but the newest HOT_KEEP are moved into a
+# gzip-compressed chunk under history_archive/<hash of user>/, so load_history
+# reads at most HOT_LIMIT records however old the account is. Chunks are only
+# decompressed to scroll further back (load_archived) or to rebuild the search
+# index. Past the per-user quota, the oldest chunks are deleted.
+#
+# Every message keeps a fixed position in the conversation. The archive
+# manifest records where each chunk starts and where the archive ends; the hot
+# file starts with a {"_start": N} line giving the position of its first
+# record. Archiving writes the chunk, then the manifest, then the trimmed hot
+# file, so after a crash in between load_history sees _start below the
+# archive end and skips the records that were already archived.
+#
+# The page and the API (a separate uvicorn process) write the same files, so
+# every write holds a per-user flock as well as this module's lock.
+FSYNC_EVERY = 8          # fsync after this many unsynced records...
+FSYNC_INTERVAL = 2.0     # ...or once this many seconds have passed
+COMPACT_EVERY = 200      # appends between tail-repair compactions
+HOT_LIMIT = 400          # hot records that trigger archiving...
+HOT_KEEP = 200           # ...of all but this many
+ARCHIVE_DIR = "history_archive"
+QUOTA = int(float(os.getenv("EDUBOT_HISTORY_QUOTA_MB", 20)) * 2**20)  # bytes per user, 0 = unlimited
+
+_lock = threading.RLock()
+_hot = {}                # username -> (first position, records, (inode, size)) of the hot file
+_appends = {}            # username -> appends since last compaction
+_unsynced = {}           # path -> (records not yet fsynced, last fsync time)
+_flocked = set()         # usernames whose flock this process holds
+
+
+class History(list):
+    # What load_history returns: the hot records plus the caller's own cursor,
+    # i.e. where they start in the conversation (`start`) and how many of them
+    # are on disk (`persisted`). Keeping the cursor on the list, not in this
+    # module, lets a page session and the API save for the same user without
+    # one of them skipping the other's turns.
+    def __init__(self, records=(), start=0):
+        super().__init__(records)
+        self.start = start
+        self.persisted = len(self)
+
+
+def history_path(username):
+    return f"history_{username}.jsonl"
+
+
+def legacy_history_path(username):
+    return f"history_{username}.json"
+
+
+def archive_dir(username):
+    # Keyed on a hash, so no username can name a directory outside ARCHIVE_DIR
+    directory = os.path.join(ARCHIVE_DIR, hashlib.sha256(username.encode("utf-8")).hexdigest()[:32])
+    root = os.path.realpath(ARCHIVE_DIR)
+    if os.path.commonpath([root, os.path.realpath(directory)]) != root:
+        raise ValueError(f"archive path for {username!r} escapes {ARCHIVE_DIR}")
+    return directory
+
+
+def _manifest_path(username):
+    return os.path.join(archive_dir(username), "manifest.json")
+
+
+@contextlib.contextmanager
+def _user_lock(username):
+    # Re-entrant: compact_history runs inside an append
+    with _lock:
+        if fcntl is None or username in _flocked:
+            yield
+            return
+        os.makedirs(ARCHIVE_DIR, exist_ok=True)
+        with open(archive_dir(username) + ".lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)  # released when the file is closed
+            _flocked.add(username)
+            try:
+                yield
+            finally:
+                _flocked.discard(username)
+
+
+# ───── files ─────
+def _lines(records):
+    return "".join(json.dumps(r) + "\n" for r in records)
+
+
+def _write_file(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".history.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def _read_records(path):
+    # Returns (position from the header or None, records, torn)
+    with open(path, "r", encoding="utf-8") as f:
+        data = f.read()
+    # A missing trailing newline means the last append was cut short; the
+    # file must be rewritten before anything else is appended to it.
+    start, records, torn = None, [], bool(data) and not data.endswith("\n")
+    for line in data.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            torn = True
+            continue
+        if start is None and not records and isinstance(record, dict) and "_start" in record:
+            start = record["_start"]
+            continue
+        records.append(record)
+    return start, records, torn
+
+
+def _write_atomic(path, records, start=0):
+    _write_file(path, _lines([{"_start": start}] + records).encode("utf-8"))
+    _unsynced.pop(path, None)
+
+
+def _append(path, records):
+    data = _lines(records)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(data)
+        f.flush()
+        pending, last_sync = _unsynced.get(path, (0, time.monotonic()))
+        pending += len(records)
+        if pending >= FSYNC_EVERY or time.monotonic() - last_sync >= FSYNC_INTERVAL:
+            os.fsync(f.fileno())
+            pending, last_sync = 0, time.monotonic()
+        _unsynced[path] = (pending, last_sync)
+
+
+def _migrate_legacy(username):
+    legacy = legacy_history_path(username)
+    if os.path.exists(legacy) and not os.path.exists(history_path(username)):
+        with open(legacy, "r") as f:
+            _write_atomic(history_path(username), json.load(f))
+        os.remove(legacy)
+
+
+# ───── archive ─────
+def _read_manifest(username):
+    try:
+        with open(_manifest_path(username), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"base": 0, "end": 0, "next": 1, "chunks": []}
+
+
+def _read_chunk(username, chunk):
+    with open(os.path.join(archive_dir(username), chunk["file"]), "rb") as f:
+        return [json.loads(line) for line in gzip.decompress(f.read()).decode("utf-8").splitlines() if line]
+
+
+def _read_hot(username):
+    # Returns (position of the first hot record, hot records, needs rewrite)
+    end = _read_manifest(username)["end"]
+    path = history_path(username)
+    if not os.path.exists(path):
+        return end, [], False
+    start, records, torn = _read_records(path)
+    if start is None:  # written before archiving existed (or only appended to)
+        start = 0
+    if start < end:  # crashed after archiving, before the hot file was trimmed
+        records, start, torn = records[end - start:], end, True
+    return start, records, torn
+
+
+def _archive(username, hot, start):
+    # hot: the hot records, hot[0] at position `start`. Moves all but the
+    # newest HOT_KEEP into a new chunk and returns how many were moved.
+    moved = len(hot) - HOT_KEEP
+    directory = archive_dir(username)
+    os.makedirs(directory, exist_ok=True)
+    manifest = _read_manifest(username)
+    name = f"{manifest['next']:06d}.jsonl.gz"
+    with metrics.span("history_archive"):
+        data = gzip.compress(_lines(hot[:moved]).encode("utf-8"))
+        _write_file(os.path.join(directory, name), data)
+        manifest["chunks"].append({"file": name, "start": start, "count": moved, "bytes": len(data)})
+        manifest["next"] += 1
+        manifest["end"] = start + moved
+        _write_file(_manifest_path(username), json.dumps(manifest).encode("utf-8"))
+        _write_atomic(history_path(username), hot[moved:], start + moved)
+    _enforce_quota(username, manifest)
+    return moved
+
+
+def _enforce_quota(username, manifest):
+    if not QUOTA:
+        return
+    used = sum(chunk["bytes"] for chunk in manifest["chunks"]) + os.path.getsize(history_path(username))
+    dropped = []
+    while manifest["chunks"] and used > QUOTA:
+        chunk = manifest["chunks"].pop(0)
+        used -= chunk["bytes"]
+        dropped.append(chunk)
+    if not dropped:
+        return
+    manifest["base"] = dropped[-1]["start"] + dropped[-1]["count"]
+    _write_file(_manifest_path(username), json.dumps(manifest).encode("utf-8"))
+    for chunk in dropped:
+        try:
+            os.remove(os.path.join(archive_dir(username), chunk["file"]))
+        except FileNotFoundError:
+            pass
+    drop_indexed(username, manifest["base"])
+    metrics.inc("history_quota_dropped_total", sum(chunk["count"] for chunk in dropped))
+
+
+def load_archived(username, before):
+    # The archived records just before position `before`, one chunk at a time:
+    # returns (position of the first record, records); (before, []) when
+    # nothing older is kept.
+    with _lock:
+        manifest = _read_manifest(username)
+    for chunk in reversed(manifest["chunks"]):
+        if chunk["start"] < before:
+            with metrics.span("load_archived"):
+                try:
+                    records = _read_chunk(username, chunk)
+                except FileNotFoundError:  # dropped by the quota meanwhile
+                    break
+            return chunk["start"], records[:before - chunk["start"]]
+    return before, []
+
+
+def archived_before(username, position):
+    # How many stored messages precede `position`
+    with _lock:
+        manifest = _read_manifest(username)
+    return max(0, min(position, manifest["end"]) - manifest["base"])
+
+
+def iter_history(username):
+    # Everything still stored, for rebuilding the search index: returns (end
+    # position, iterator of (position, record)). Decompresses the whole archive.
+    with _lock:
+        chunks = _read_manifest(username)["chunks"]
+        start, hot, _ = _read_hot(username)
+
+    def records():
+        for chunk in chunks:
+            try:
+                yield from enumerate(_read_chunk(username, chunk), chunk["start"])
+            except FileNotFoundError:
+                continue
+        yield from enumerate(hot, start)
+
+    return start + len(hot), records()
+
+
+# ───── hot file state (caller holds _user_lock) ─────
+def _stamp(path):
+    # Changes with every append (size) and every rewrite (os.replace: inode)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_size
+
+
+def _hot_state(username):
+    # (first position, records, stamp) of the hot file; re-read whenever the
+    # file is not the one this process last wrote
+    path = history_path(username)
+    stamp = _stamp(path)
+    state = _hot.get(username)
+    if state is None or state[2] != stamp:
+        start, records, torn = _read_hot(username)
+        if torn:
+            _write_atomic(path, records, start)
+            stamp = _stamp(path)
+        state = _hot[username] = (start, len(records), stamp)
+    return state
+
+
+def _append_records(username, records):
+    # The one write path for new records: they always land at the end of the
+    # hot file, whoever appends them
+    start, count, _ = _hot_state(username)
+    path = history_path(username)
+    if not os.path.exists(path):
+        _write_atomic(path, [], start)
+    _append(path, records)
+    index_history(username, records, start + count)
+    count += len(records)
+    _hot[username] = (start, count, _stamp(path))
+    _appends[username] = _appends.get(username, 0) + 1
+    if count > HOT_LIMIT:
+        start, hot, _ = _read_hot(username)
+        _archive(username, hot, start)
+        _hot.pop(username, None)
+        _appends[username] = 0
+    elif _appends[username] >= COMPACT_EVERY:
+        compact_history(username)
+
+
+# ───── public API ─────
+def compact_history(username):
+    # Rewrites the hot log atomically with only the valid records.
+    with _user_lock(username):
+        path = history_path(username)
+        if not os.path.exists(path):
+            return
+        start, records, _ = _read_hot(username)
+        _write_atomic(path, records, start)
+        _hot.pop(username, None)
+        _appends[username] = 0
+
+
+@metrics.timed("load_history")
+def load_history(username):
+    # The hot (recent) records as a History; older ones come from load_archived.
+    with _user_lock(username):
+        _migrate_legacy(username)
+        start, records, torn = _read_hot(username)
+        if len(records) > HOT_LIMIT:  # a log from before archiving existed
+            moved = _archive(username, records, start)
+            records, start = records[moved:], start + moved
+        elif torn:
+            _write_atomic(history_path(username), records, start)
+        _hot.pop(username, None)
+        return History(records, start)
+
+
+@metrics.timed("save_history")
+def save_history(username, history):
+    # `history` is the History from load_history plus new turns; only the
+    # records added since its last save are appended. If it got shorter than
+    # what it has on disk, the hot file is rewritten from it. A plain list has
+    # no cursor, and guessing one from the file would drop or repeat turns.
+    if not isinstance(history, History):
+        raise TypeError("save_history takes the History returned by load_history")
+    with _user_lock(username):
+        start, done = history.start, history.persisted
+        if len(history) < done:
+            hot_start = _hot_state(username)[0]
+            _write_atomic(history_path(username), history[max(0, hot_start - start):], hot_start)
+            _hot.pop(username, None)
+            reindex_history(username)
+        elif len(history) > done:
+            _append_records(username, history[done:])
+        history.persisted = len(history)
+
+
+def append_history(username, *records):
+    # For writers that do not keep a list around (API requests, jobs)
+    with _user_lock(username):
+        _append_records(username, list(records))
+
+
+def clear_history(username):
+    with _user_lock(username):
+        for path in (history_path(username), legacy_history_path(username)):
+            if os.path.exists(path):
+                os.remove(path)
+            _unsynced.pop(path, None)
+        shutil.rmtree(archive_dir(username), ignore_errors=True)
+        _hot.pop(username, None)
+        _appends.pop(username, None)
+        forget_history(username)
+
+
+@atexit.register
+def flush_all():
+    with _lock:
+        for path, (pending, _) in list(_unsynced.items()):
+            if pending and os.path.exists(path):
+                with open(path, "a") as f:
+                    os.fsync(f.fileno())
+        _unsynced.clear()
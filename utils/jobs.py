@@ -0,0 +1,118 @@
+# utils/jobs.py
+
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import metrics
+
+# Long PDF tasks run here instead of inline in the Streamlit script, so the
+# session stays interactive. Jobs are mostly waiting on the LLM, hence
+# threads. The table is keyed by user; the page polls it and claims finished
+# jobs, so the session's chat_history stays the only writer of the history
+# file.
+JOB_WORKERS = int(os.getenv("EDUBOT_JOB_WORKERS", 4))
+MAX_ACTIVE_PER_USER = 2        # queued + running jobs per user
+FINISHED_TTL = 24 * 60 * 60    # unclaimed finished jobs are dropped after this
+
+
+class JobLimitReached(Exception):
+    pass
+
+
+class JobRunner:
+    def __init__(self, max_workers=JOB_WORKERS, max_active_per_user=MAX_ACTIVE_PER_USER):
+        self.max_active_per_user = max_active_per_user
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="edubot-job")
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._jobs = {}       # job id -> job dict
+        self._by_user = {}    # username -> job ids in submit order
+
+    # ───── internals ─────
+    def _set(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields)
+
+    def _run(self, job_id, fn):
+        self._set(job_id, state="running", started=time.time())
+
+        def progress(done, total):
+            self._set(job_id, done=done, total=total)
+
+        try:
+            with metrics.span("job_run"):
+                result = fn(progress)
+        except Exception as e:
+            self._set(job_id, state="failed", error=str(e), finished=time.time())
+        else:
+            self._set(job_id, state="done", result=result, finished=time.time())
+
+    def _expire(self, now):
+        # Caller holds the lock
+        for job_id, job in list(self._jobs.items()):
+            if job["finished"] and now - job["finished"] > FINISHED_TTL:
+                self._forget(job_id)
+
+    def _forget(self, job_id):
+        job = self._jobs.pop(job_id)
+        ids = self._by_user.get(job["username"], [])
+        if job_id in ids:
+            ids.remove(job_id)
+        if not ids:
+            self._by_user.pop(job["username"], None)
+
+    # ───── public API ─────
+    def submit(self, username, label, fn):
+        # fn(progress) -> result, where progress(done, total) reports progress
+        with self._lock:
+            self._expire(time.time())
+            active = [j for j in self._by_user.get(username, []) if self._jobs[j]["state"] in ("queued", "running")]
+            if len(active) >= self.max_active_per_user:
+                raise JobLimitReached(f"You already have {len(active)} PDF tasks running. Please wait for one to finish.")
+            job_id = next(self._ids)
+            self._jobs[job_id] = {
+                "id": job_id, "username": username, "label": label, "state": "queued",
+                "done": 0, "total": 0, "result": None, "error": None,
+                "created": time.time(), "started": None, "finished": None,
+            }
+            self._by_user.setdefault(username, []).append(job_id)
+        self._pool.submit(self._run, job_id, fn)
+        return job_id
+
+    def get(self, username, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None and job["username"] == username else None
+
+    def jobs(self, username):
+        with self._lock:
+            return [dict(self._jobs[j]) for j in self._by_user.get(username, [])]
+
+    def has_finished(self, username):
+        with self._lock:
+            return any(self._jobs[j]["finished"] for j in self._by_user.get(username, []))
+
+    def claim_finished(self, username):
+        # Finished jobs (done or failed) in submit order, removed from the table
+        with self._lock:
+            claimed = [self._jobs[j] for j in self._by_user.get(username, []) if self._jobs[j]["finished"]]
+            for job in claimed:
+                self._forget(job["id"])
+            return claimed
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner():
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner()
+        return _runner
@@ -0,0 +1,307 @@
+# utils/llm_client.py
+
+import email.utils
+import json
+import os
+import random
+import threading
+import time
+
+from utils import metrics
+from utils.tokens import estimate_message_tokens, estimate_tokens
+
+DEFAULT_MODEL = "openrouter/free"
+
+MAX_RETRIES = 3                 # retries after the first attempt
+BACKOFF_BASE = 0.5              # seconds; doubled per attempt, full jitter
+BACKOFF_MAX = 8.0               # cap for both backoff and Retry-After waits
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BREAKER_FAILURES = 5            # consecutive failures before the circuit opens
+BREAKER_RESET = 30.0            # seconds before a half-open probe is allowed
+
+
+# ───── typed errors (never stored in chat_history) ─────
+class LLMError(Exception):
+    def __init__(self, message, status=None, partial=""):
+        super().__init__(message)
+        self.status = status
+        self.partial = partial  # text already streamed before the failure
+
+
+class LLMTimeoutError(LLMError):
+    pass
+
+
+class LLMRateLimitError(LLMError):
+    pass
+
+
+class CircuitOpenError(LLMError):
+    pass
+
+
+# ───── pooled session ─────
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    # One keep-alive connection pool for the whole process, shared by every
+    # Streamlit session thread, so repeat calls skip the TCP/TLS handshake.
+    # requests is imported here rather than at module level so pages that
+    # only reference the client don't pay for it before first paint.
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+# ───── circuit breaker ─────
+class CircuitBreaker:
+    def __init__(self, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probe_at = None   # when the half-open trial call was let through
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def before_call(self):
+        # Half-open lets exactly one trial call through; the rest fail fast
+        # until it succeeds or fails. A trial that never reports back (an
+        # abandoned stream) gives way to a new one after reset_timeout.
+        with self._lock:
+            if self._opened_at is None:
+                return
+            now = time.monotonic()
+            probing = self._probe_at is not None and now - self._probe_at < self.reset_timeout
+            if now - self._opened_at < self.reset_timeout or probing:
+                raise CircuitOpenError("The AI service is temporarily unavailable. Please try again shortly.")
+            self._probe_at = now
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_at = None
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+breaker = CircuitBreaker()
+
+
+# ───── request plumbing ─────
+def default_base_url():
+    # OPENROUTER_BASE_URL lets us point at a local OpenAI-compatible/fake server
+    return os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+
+
+def chat_completions_url(base_url=None):
+    return (base_url or default_base_url()).rstrip("/") + "/chat/completions"
+
+
+def build_headers(api_key=None):
+    return {
+        "Authorization": f"Bearer {api_key or os.getenv('OPENROUTER_API_KEY')}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": "https://streamlit.app",
+        "X-Title": "EduyyBot"
+    }
+
+
+def retry_after_seconds(response):
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None  # malformed header: fall back to the default backoff
+    return max(0.0, parsed.timestamp() - time.time())
+
+
+def backoff_delay(attempt, response=None):
+    hinted = retry_after_seconds(response) if response is not None else None
+    if hinted is not None:
+        return min(hinted, BACKOFF_MAX)
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def _error_message(error):
+    # OpenRouter sends {"message": ..., "code": ...}; some upstreams a bare string
+    if isinstance(error, dict):
+        return str(error.get("message") or error)
+    return str(error)
+
+
+def _error_for(response):
+    try:
+        body = response.json()
+    except ValueError:
+        body = None
+    error = body.get("error") if isinstance(body, dict) else None
+    detail = (_error_message(error) if error else "") or response.text
+    cls = LLMRateLimitError if response.status_code == 429 else LLMError
+    return cls(f"HTTP {response.status_code}: {detail[:200]}", status=response.status_code)
+
+
+def post_chat(payload, timeout=60, stream=False, base_url=None, api_key=None,
+              circuit=None, retries=MAX_RETRIES):
+    # POSTs to the chat-completions endpoint with retry/backoff on 429/5xx and
+    # connection errors, behind the circuit breaker. Returns the open response.
+    # base_url/api_key/circuit select another endpoint (see utils.model_router).
+    # A stream only counts as a success once stream_openrouter has read it to
+    # the end.
+    import requests
+    circuit = circuit or breaker
+    circuit.before_call()
+    session = get_session()
+    for attempt in range(retries + 1):
+        last = attempt == retries
+        try:
+            response = session.post(
+                chat_completions_url(base_url),
+                headers=build_headers(api_key),
+                json=payload,
+                timeout=timeout,
+                stream=stream
+            )
+        except requests.Timeout as e:
+            error = LLMTimeoutError(f"Request timed out: {e}")
+            response = None
+        except requests.ConnectionError as e:
+            error = LLMError(f"Connection failed: {e}")
+            response = None
+        except requests.RequestException as e:  # e.g. ChunkedEncodingError reading the body
+            error = LLMError(f"Request failed: {e}")
+            response = None
+        else:
+            if response.ok:
+                if not stream:
+                    circuit.record_success()
+                return response
+            error = _error_for(response)
+            response.close()
+            if response.status_code not in RETRY_STATUSES:
+                raise error  # our request is at fault, not the service
+        if last:
+            circuit.record_failure()
+            raise error
+        time.sleep(backoff_delay(attempt, response))
+
+
+def _count_tokens(messages, reply, usage=None):
+    # Prefer the provider's usage block; fall back to the chars/4 estimate.
+    if not metrics.ENABLED:
+        return
+    usage = usage or {}
+    tokens_in = usage.get("prompt_tokens") or sum(estimate_message_tokens(m) for m in messages)
+    tokens_out = usage.get("completion_tokens") or estimate_tokens(reply)
+    metrics.inc("llm_tokens_in_total", tokens_in)
+    metrics.inc("llm_tokens_out_total", tokens_out)
+
+
+def ask_openrouter(messages, model=DEFAULT_MODEL, timeout=60, **endpoint):
+    # **endpoint: base_url / api_key / circuit / retries, passed to post_chat
+    with metrics.span("llm_request", mode="blocking"):
+        response = post_chat({"model": model, "messages": messages}, timeout=timeout, **endpoint)
+        try:
+            data = response.json()
+            reply = data["choices"][0]["message"]["content"].strip()
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            raise LLMError(f"Malformed response: {e}")
+    _count_tokens(messages, reply, data.get("usage"))
+    return reply
+
+
+# ───── STREAMING (SSE, "stream": true) ─────
+def iter_sse_data(lines):
+    # Yields the payload of every `data:` field. Comment lines (": OPENROUTER
+    # PROCESSING" keep-alives) and blank separators are skipped.
+    for line in lines:
+        if not line or line.startswith(":"):
+            continue
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return
+        yield data
+
+
+def stream_openrouter(messages, model=DEFAULT_MODEL, timeout=60, **endpoint):
+    # Generator of content deltas. Retries only cover establishing the stream;
+    # a failure mid-stream raises LLMError and counts against the breaker.
+    import requests
+    circuit = endpoint.get("circuit") or breaker
+    payload = {"model": model, "messages": messages, "stream": True}
+    with post_chat(payload, timeout=timeout, stream=True, **endpoint) as response:
+        response.encoding = "utf-8"
+        try:
+            for data in iter_sse_data(response.iter_lines(decode_unicode=True)):
+                chunk = json.loads(data)
+                if "error" in chunk:
+                    raise LLMError(_error_message(chunk["error"]))
+                choices = chunk.get("choices") or []
+                if not choices:
+                    continue
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+        except LLMError:
+            circuit.record_failure()
+            raise
+        except requests.RequestException as e:
+            circuit.record_failure()
+            raise LLMError(f"Stream interrupted: {e}")
+        except ValueError as e:
+            circuit.record_failure()
+            raise LLMError(f"Malformed stream chunk: {e}")
+        circuit.record_success()
+
+
+def collect_stream(messages, on_delta=None, model=DEFAULT_MODEL, timeout=60, **endpoint):
+    # Drains stream_openrouter, calling on_delta(partial_text) as tokens arrive,
+    # and returns the fully assembled reply (same shape as ask_openrouter). The
+    # running string is extended in place rather than re-joined per delta.
+    partial = ""
+    try:
+        with metrics.span("llm_request", mode="stream"):
+            for delta in stream_openrouter(messages, model=model, timeout=timeout, **endpoint):
+                partial += delta
+                if on_delta:
+                    on_delta(partial)
+    except LLMError as e:
+        e.partial = partial
+        raise
+    reply = partial.strip()
+    _count_tokens(messages, reply)
+    return reply
@@ -0,0 +1,159 @@
+# utils/mailer.py
+
+import itertools
+import queue
+import smtplib
+import ssl
+import threading
+import time
+from collections import OrderedDict, deque
+
+RATE_PER_MINUTE = 30            # messages per minute over the shared connection
+PER_RECIPIENT_LIMIT = 3         # messages to one address...
+PER_RECIPIENT_WINDOW = 10 * 60  # ...within this many seconds
+IDLE_CLOSE_SECONDS = 60         # close the SMTP connection after this long idle
+MAX_STATUS_ENTRIES = 1000
+
+
+class MailDispatcher:
+    # Background queue for outgoing mail. A single worker thread owns one
+    # authenticated SMTP connection and reuses it across messages, so the
+    # Streamlit script only enqueues and returns. Every message gets a job id
+    # whose status moves queued -> sending -> sent | failed (or rate_limited).
+
+    def __init__(self, host, port, user=None, password=None, starttls=True,
+                 rate_per_minute=RATE_PER_MINUTE, per_recipient_limit=PER_RECIPIENT_LIMIT,
+                 per_recipient_window=PER_RECIPIENT_WINDOW, idle_close=IDLE_CLOSE_SECONDS, timeout=20):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.min_interval = 60.0 / rate_per_minute if rate_per_minute else 0.0
+        self.per_recipient_limit = per_recipient_limit
+        self.per_recipient_window = per_recipient_window
+        self.idle_close = idle_close
+        self.timeout = timeout
+
+        self._queue = queue.Queue()
+        self._status = OrderedDict()
+        self._recent = {}                 # recipient -> deque of send timestamps
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._smtp = None
+        self._last_send = 0.0
+        self._worker = threading.Thread(target=self._run, name="mail-dispatcher", daemon=True)
+        self._worker.start()
+
+    # ───── public API ─────
+    def submit(self, msg):
+        recipient = msg["To"]
+        now = time.time()
+        with self._lock:
+            job_id = next(self._ids)
+            recent = self._recent.setdefault(recipient, deque())
+            while recent and now - recent[0] > self.per_recipient_window:
+                recent.popleft()
+            if len(recent) >= self.per_recipient_limit:
+                self._set_status(job_id, "rate_limited", "Too many e-mails to this address. Try again later.")
+                return job_id
+            recent.append(now)
+            self._set_status(job_id, "queued")
+        self._queue.put((job_id, msg))
+        return job_id
+
+    def status(self, job_id):
+        with self._lock:
+            return dict(self._status.get(job_id, {"state": "unknown", "error": None}))
+
+    def wait(self, job_id, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            state = self.status(job_id)
+            if state["state"] not in ("queued", "sending"):
+                return state
+            if deadline is not None and time.monotonic() >= deadline:
+                return state
+            time.sleep(0.05)
+
+    def close(self):
+        self._queue.put(None)
+        self._worker.join(timeout=5)
+
+    # ───── worker ─────
+    def _set_status(self, job_id, state, error=None):
+        self._status[job_id] = {"state": state, "error": error, "updated": time.time()}
+        self._status.move_to_end(job_id)
+        while len(self._status) > MAX_STATUS_ENTRIES:
+            self._status.popitem(last=False)
+
+    def _connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            smtp.starttls(context=ssl.create_default_context())
+        if self.user:
+            smtp.login(self.user, self.password)
+        return smtp
+
+    def _disconnect(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._smtp = None
+
+    def _send(self, msg):
+        # Reuse the open connection; reconnect once if the server dropped it.
+        for attempt in range(2):
+            if self._smtp is None:
+                self._smtp = self._connect()
+            try:
+                self._smtp.send_message(msg)
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                self._smtp = None
+                if attempt:
+                    raise
+
+    def _throttle(self):
+        wait = self._last_send + self.min_interval - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        self._last_send = time.monotonic()
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.idle_close)
+            except queue.Empty:
+                self._disconnect()
+                continue
+            if item is None:
+                self._disconnect()
+                return
+            job_id, msg = item
+            with self._lock:
+                self._set_status(job_id, "sending")
+            self._throttle()
+            try:
+                self._send(msg)
+            except Exception as e:
+                self._disconnect()
+                with self._lock:
+                    self._set_status(job_id, "failed", str(e))
+            else:
+                with self._lock:
+                    self._set_status(job_id, "sent")
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_mail_dispatcher(host, port, user=None, password=None, starttls=True):
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = MailDispatcher(host, port, user, password, starttls)
+        return _dispatcher
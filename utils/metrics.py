@@ -0,0 +1,211 @@
+# utils/metrics.py
+
+import json
+import os
+import threading
+import time
+from functools import wraps
+
+# EDUBOT_METRICS=1 turns instrumentation on. When it is off, span() hands
+# back a shared no-op context manager and @timed returns the function
+# untouched, so the disabled cost is one attribute lookup per call site.
+ENABLED = os.getenv("EDUBOT_METRICS", "0") == "1"
+METRICS_PORT = int(os.getenv("EDUBOT_METRICS_PORT", 9464))   # 0 = no HTTP endpoint
+JSON_DUMP_PATH = os.getenv("EDUBOT_METRICS_JSON")            # periodic JSON snapshot
+JSON_DUMP_INTERVAL = float(os.getenv("EDUBOT_METRICS_JSON_INTERVAL", 30))
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+PREFIX = "edubot_"
+
+_lock = threading.Lock()
+_counters = {}      # (name, labels) -> value
+_histograms = {}    # (name, labels) -> [count, sum, bucket counts...]
+_collectors = []    # callables returning {gauge_name: value}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+# ───── recording ─────
+def inc(name, value=1, **labels):
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [0, 0.0] + [0] * len(BUCKETS)
+        hist[0] += 1
+        hist[1] += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                hist[2 + i] += 1
+
+
+class _Span:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+        if exc_type is not None:
+            inc("errors_total", where=self.name, type=exc_type.__name__)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP = _NoopSpan()
+
+
+def span(name, **labels):
+    return _Span(name, labels) if ENABLED else _NOOP
+
+
+def timed(name):
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Span(name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def register_collector(fn):
+    # fn() -> {name: value}, sampled as gauges at export time (e.g. cache stats)
+    _collectors.append(fn)
+
+
+# ───── export ─────
+def _labels_text(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+def render_prometheus():
+    lines = []
+    with _lock:
+        counters = dict(_counters)
+        histograms = {k: list(v) for k, v in _histograms.items()}
+    typed = set()
+    for (name, labels), value in sorted(counters.items()):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+        lines.append(f"{PREFIX}{name}{_labels_text(labels)} {value}")
+    for (name, labels), hist in sorted(histograms.items()):
+        metric = f"{PREFIX}{name}_seconds"
+        if metric not in typed:
+            typed.add(metric)
+            lines.append(f"# TYPE {metric} histogram")
+        for bound, count in zip(BUCKETS, hist[2:]):
+            lines.append(f"{metric}_bucket{_labels_text(labels, [('le', bound)])} {count}")
+        lines.append(f"{metric}_bucket{_labels_text(labels, [('le', '+Inf')])} {hist[0]}")
+        lines.append(f"{metric}_sum{_labels_text(labels)} {hist[1]:.6f}")
+        lines.append(f"{metric}_count{_labels_text(labels)} {hist[0]}")
+    for collector in _collectors:
+        for name, value in collector().items():
+            lines.append(f"# TYPE {PREFIX}{name} gauge")
+            lines.append(f"{PREFIX}{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def snapshot():
+    with _lock:
+        counters = {f"{n}{_labels_text(l)}": v for (n, l), v in _counters.items()}
+        timings = {
+            f"{n}{_labels_text(l)}": {"count": h[0], "sum": round(h[1], 6), "avg": round(h[1] / h[0], 6) if h[0] else 0.0}
+            for (n, l), h in _histograms.items()
+        }
+    gauges = {}
+    for collector in _collectors:
+        gauges.update(collector())
+    return {"timestamp": time.time(), "counters": counters, "timings": timings, "gauges": gauges}
+
+
+def _serve(port):
+    # http.server drags in email/html/mimetypes, so it is only imported
+    # when the exporter is actually switched on.
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] == "/metrics":
+                body, ctype = render_prometheus().encode(), "text/plain; version=0.0.4"
+            elif self.path.split("?")[0] == "/metrics.json":
+                body, ctype = json.dumps(snapshot()).encode(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    try:
+        server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    except OSError:
+        return  # port taken (e.g. another worker already exports)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+
+
+def _dump_loop():
+    while True:
+        time.sleep(JSON_DUMP_INTERVAL)
+        tmp = JSON_DUMP_PATH + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(snapshot(), f)
+        os.replace(tmp, JSON_DUMP_PATH)
+
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def start_exporter():
+    # Idempotent: Streamlit re-executes the page script on every rerun.
+    global _started
+    if not ENABLED:
+        return
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+        if METRICS_PORT:
+            _serve(METRICS_PORT)
+        if JSON_DUMP_PATH:
+            threading.Thread(target=_dump_loop, name="metrics-json", daemon=True).start()
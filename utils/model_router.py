@@ -0,0 +1,172 @@
+# utils/model_router.py
+
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from utils import metrics
+from utils.llm_client import (
+    DEFAULT_MODEL, MAX_RETRIES, CircuitBreaker, LLMError,
+    ask_openrouter, collect_stream, default_base_url
+)
+from utils.tokens import estimate_message_tokens
+
+# Routes each LLM call to one of several OpenAI-compatible endpoints.
+# EDUBOT_MODELS holds a JSON list (or the path of a JSON file) of routes:
+#   [{"name": "free", "model": "openrouter/free", "context_tokens": 32000},
+#    {"name": "long", "model": "google/gemini-flash-1.5", "context_tokens": 1000000},
+#    {"name": "local", "model": "llama3", "base_url": "http://localhost:11434/v1",
+#     "api_key_env": null, "context_tokens": 8192}]
+# base_url defaults to OPENROUTER_BASE_URL and api_key_env to OPENROUTER_API_KEY.
+# Every route keeps rolling latency and error stats. Chat turns go to the
+# fastest healthy route, PDF tasks to the healthy route with the largest
+# context, and a failing route falls through to the next candidate.
+MODELS_CONFIG = os.getenv("EDUBOT_MODELS")
+STATS_WINDOW = 50              # calls per route kept for p50/p95/error rate
+MIN_SAMPLES = 3                # fewer calls than this = untried, explored first
+MAX_ERROR_RATE = 0.5           # above this a route is demoted
+SLOW_P95 = 30.0                # seconds; p95 above this demotes a route
+DEFAULT_CONTEXT_TOKENS = 32000
+
+
+def _percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ModelRoute:
+    def __init__(self, name, model=None, base_url=None, api_key_env="OPENROUTER_API_KEY",
+                 context_tokens=DEFAULT_CONTEXT_TOKENS, timeout=60):
+        self.name = name
+        self.model = model or name
+        self.base_url = base_url
+        self.api_key_env = api_key_env
+        self.context_tokens = context_tokens
+        self.timeout = timeout
+        self.circuit = CircuitBreaker()
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=STATS_WINDOW)   # seconds, successful calls
+        self._outcomes = deque(maxlen=STATS_WINDOW)    # True = success
+
+    def endpoint(self, retries):
+        # Keyword arguments for the llm_client call functions
+        return {
+            "model": self.model,
+            "timeout": self.timeout,
+            "base_url": self.base_url or default_base_url(),
+            # A local stand-in may need no key; "-" keeps the header well-formed
+            "api_key": os.getenv(self.api_key_env, "") if self.api_key_env else "-",
+            "circuit": self.circuit,
+            "retries": retries,
+        }
+
+    def record(self, ok, latency=None):
+        with self._lock:
+            self._outcomes.append(ok)
+            if ok and latency is not None:
+                self._latencies.append(latency)
+
+    def stats(self):
+        with self._lock:
+            latencies, outcomes = list(self._latencies), list(self._outcomes)
+        return {
+            "name": self.name,
+            "model": self.model,
+            "calls": len(outcomes),
+            "p50": _percentile(latencies, 0.5) if latencies else None,
+            "p95": _percentile(latencies, 0.95) if latencies else None,
+            "error_rate": round(outcomes.count(False) / len(outcomes), 3) if outcomes else 0.0,
+            "circuit": self.circuit.state,
+        }
+
+    def healthy(self, stats):
+        if stats["circuit"] == "open":
+            return False
+        if stats["calls"] >= MIN_SAMPLES and stats["error_rate"] > MAX_ERROR_RATE:
+            return False
+        return stats["p95"] is None or stats["p95"] <= SLOW_P95
+
+
+class ModelRouter:
+    def __init__(self, routes):
+        if not routes:
+            raise ValueError("ModelRouter needs at least one route")
+        self.routes = routes
+
+    def candidates(self, kind="chat", prompt_tokens=0):
+        # Routes in the order they should be tried: healthy before demoted,
+        # then by context size (kind="long") or by median latency (chat),
+        # with untried routes explored first so they get stats.
+        scored = []
+        for index, route in enumerate(self.routes):
+            stats = route.stats()
+            fits = route.context_tokens >= prompt_tokens
+            untried = stats["calls"] < MIN_SAMPLES
+            if kind == "long":
+                speed = (-route.context_tokens, stats["p50"] or 0.0)
+            else:
+                speed = (not untried, stats["p50"] or 0.0)
+            scored.append(((not route.healthy(stats), not fits) + speed + (index,), route))
+        return [route for _, route in sorted(scored, key=lambda item: item[0])]
+
+    def _attempts(self, messages, kind):
+        prompt_tokens = sum(estimate_message_tokens(m) for m in messages)
+        order = self.candidates(kind, prompt_tokens)
+        for position, route in enumerate(order):
+            # With a fallback available, fail over instead of retrying in place
+            retries = MAX_RETRIES if position == len(order) - 1 else 1
+            yield route, route.endpoint(retries), position == len(order) - 1
+
+    def _call(self, messages, kind, call):
+        error = None
+        for route, endpoint, last in self._attempts(messages, kind):
+            start = time.perf_counter()
+            try:
+                reply = call(endpoint)
+            except LLMError as e:
+                route.record(False)
+                if e.partial or last:
+                    raise  # text was already shown; restarting elsewhere would duplicate it
+                metrics.inc("llm_failover_total", route=route.name)
+                error = e
+                continue
+            route.record(True, time.perf_counter() - start)
+            return reply
+        raise error
+
+    # ───── public API (same shapes as ask_openrouter / collect_stream) ─────
+    def ask(self, messages, kind="chat"):
+        return self._call(messages, kind, lambda endpoint: ask_openrouter(messages, **endpoint))
+
+    def collect_stream(self, messages, on_delta=None, kind="chat"):
+        return self._call(messages, kind, lambda endpoint: collect_stream(messages, on_delta, **endpoint))
+
+    def asker(self, kind):
+        # ask(messages) -> str bound to a kind, for summarizer/context_window hooks
+        return lambda messages: self.ask(messages, kind)
+
+    def stats(self):
+        return [route.stats() for route in self.routes]
+
+
+def load_routes(config=MODELS_CONFIG):
+    if not config:
+        return [ModelRoute(DEFAULT_MODEL)]
+    if os.path.exists(config):
+        with open(config) as f:
+            config = f.read()
+    return [ModelRoute(**entry) for entry in json.loads(config)]
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_model_router():
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = ModelRouter(load_routes())
+        return _router
@@ -0,0 +1,314 @@
+# utils/pdf_extract.py
+
+import hashlib
+import io
+import json
+import mmap
+import multiprocessing
+import os
+import tempfile
+import threading
+import weakref
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import metrics
+
+# Backend: "pdfplumber" (default, same output as before), "pymupdf" (much
+# faster, needs the optional pymupdf package) or "auto" (pymupdf if present).
+PDF_BACKEND = os.getenv("EDUBOT_PDF_BACKEND", "pdfplumber")
+CACHE_DIR = os.path.join(os.getenv("EDUBOT_CACHE_DIR", ".cache"), "pdf_pages")
+DISK_CACHE_BYTES = 256 * 1024 * 1024  # on-disk document store budget
+PAGES_PER_TASK = 16                   # pages handed to one pool worker at a time
+MAX_WORKERS = max(1, min(4, (os.cpu_count() or 1)))
+SPOOL_CHUNK = 1024 * 1024             # bytes copied per read when spooling uploads
+
+# Uploads are streamed to a temp file, pages are extracted lazily and written
+# straight into an on-disk per-document store ({digest}.{backend}.txt plus a
+# page-offset index). Sessions keep only a PdfDocument handle, so memory use
+# does not grow with the size or number of uploaded documents.
+
+_ingest_locks = {}             # (digest, backend) -> lock, so one session ingests
+_ingest_locks_lock = threading.Lock()
+_open_docs = weakref.WeakSet()  # live PdfDocument handles; eviction skips them
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pdf_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _import_pymupdf():
+    try:
+        import pymupdf
+    except ImportError:  # pymupdf < 1.24 only ships the `fitz` name
+        import fitz as pymupdf
+    return pymupdf
+
+
+def resolve_backend(backend=None):
+    backend = backend or PDF_BACKEND
+    if backend in ("auto", "pymupdf"):
+        try:
+            _import_pymupdf()
+            return "pymupdf"
+        except ImportError:
+            if backend == "pymupdf":
+                raise
+    return "pdfplumber"
+
+
+# ───── page extraction (runs inside pool workers) ─────
+# `source` is a file path or the PDF bytes.
+def _open(source, backend):
+    if backend == "pymupdf":
+        pymupdf = _import_pymupdf()
+        if isinstance(source, str):
+            return pymupdf.open(source)
+        return pymupdf.open(stream=source, filetype="pdf")
+    import pdfplumber
+    return pdfplumber.open(source if isinstance(source, str) else io.BytesIO(source))
+
+
+def count_pages(source, backend):
+    with _open(source, backend) as doc:
+        return doc.page_count if backend == "pymupdf" else len(doc.pages)
+
+
+def _iter_range(doc, start, stop, backend):
+    for i in range(start, stop):
+        if backend == "pymupdf":
+            yield doc[i].get_text() or ""
+            continue
+        page = doc.pages[i]
+        yield page.extract_text() or ""
+        # drop the parsed layout objects, they dwarf the text
+        getattr(page, "close", getattr(page, "flush_cache", lambda: None))()
+
+
+def extract_page_range(source, start, stop, backend):
+    with _open(source, backend) as doc:
+        return list(_iter_range(doc, start, stop, backend))
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the Streamlit server process is multi-threaded
+            _pool = ProcessPoolExecutor(
+                max_workers=MAX_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def iter_pages(source, backend=None, parallel=True):
+    # Yields page texts in order. In parallel mode at most 2 * MAX_WORKERS
+    # page batches are in flight, so a huge document never sits in memory.
+    backend = resolve_backend(backend)
+    n_pages = count_pages(source, backend)
+    if not parallel or MAX_WORKERS == 1 or n_pages <= PAGES_PER_TASK:
+        with _open(source, backend) as doc:
+            yield from _iter_range(doc, 0, n_pages, backend)
+        return
+    pool = _get_pool()
+    starts = iter(range(0, n_pages, PAGES_PER_TASK))
+    in_flight = deque()
+    for start in starts:
+        in_flight.append(pool.submit(extract_page_range, source, start, min(start + PAGES_PER_TASK, n_pages), backend))
+        if len(in_flight) >= 2 * MAX_WORKERS:
+            yield from in_flight.popleft().result()
+    while in_flight:
+        yield from in_flight.popleft().result()
+
+
+def extract_pages(source, backend=None, parallel=True):
+    return list(iter_pages(source, backend, parallel))
+
+
+# ───── on-disk document store keyed by content hash ─────
+def _store_paths(digest, backend):
+    base = os.path.join(CACHE_DIR, f"{digest}.{backend}")
+    return base + ".txt", base + ".idx.json"
+
+
+class PdfDocument:
+    # Handle to an ingested document. Page text lives in the store file and
+    # is read through mmap on demand; only the digest, backend and page
+    # offsets are held in memory.
+
+    def __init__(self, digest, backend):
+        self.digest = digest
+        self.backend = backend
+        self.text_path, self.index_path = _store_paths(digest, backend)
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            self._offsets = json.load(f)["offsets"]   # byte offset of each page, plus the end
+        _open_docs.add(self)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    @property
+    def size(self):
+        return self._offsets[-1]
+
+    def exists(self):
+        return os.path.exists(self.text_path) and os.path.exists(self.index_path)
+
+    def _read(self, start, stop):
+        if start == stop:
+            return ""
+        with open(self.text_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            return m[start:stop].decode("utf-8")
+
+    def page(self, i):
+        return self._read(self._offsets[i], self._offsets[i + 1]).removesuffix("\n")
+
+    def iter_pages(self):
+        for i in range(len(self)):
+            yield self.page(i)
+
+    def text(self):
+        # Same layout as the old extraction loop: non-empty pages, each
+        # followed by "\n". Callers hold it only for the task at hand.
+        return self._read(0, self.size)
+
+
+def _open_stored(digest, backend):
+    try:
+        doc = PdfDocument(digest, backend)
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        return None
+    if not os.path.exists(doc.text_path):
+        return None
+    os.utime(doc.index_path)  # mtime doubles as the LRU timestamp
+    return doc
+
+
+def open_document(digest, backend=None):
+    # Handle for an already-ingested document, or None if it is not (or no
+    # longer) in the store
+    return _open_stored(digest, resolve_backend(backend))
+
+
+def _write_store(source, digest, backend):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    text_path, index_path = _store_paths(digest, backend)
+    offsets = [0]
+    fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for text in iter_pages(source, backend):
+                if text:
+                    f.write((text + "\n").encode("utf-8"))
+                offsets.append(f.tell())
+        os.replace(tmp, text_path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    # The index is written last: its presence marks a complete document
+    fd, tmp = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"offsets": offsets}, f)
+    os.replace(tmp, index_path)
+    _disk_evict(keep=f"{digest}.{backend}")
+
+
+def _disk_evict(keep=None):
+    # Whole documents are evicted least recently used first. `keep` (the one
+    # just written) and documents with a live handle in this process (a
+    # session's upload, a running job) survive even over the budget. Other
+    # sessions may evict or ingest concurrently, so vanished files are skipped.
+    pinned = {f"{doc.digest}.{doc.backend}" for doc in list(_open_docs)}
+    if keep:
+        pinned.add(keep)
+    docs, kept = {}, 0
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith(".tmp"):
+            continue
+        path = os.path.join(CACHE_DIR, name)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        key = ".".join(name.split(".")[:2])  # "{digest}.{backend}"
+        if key in pinned:
+            kept += st.st_size
+            continue
+        mtime, size, paths = docs.get(key, (0, 0, []))
+        docs[key] = (max(mtime, st.st_mtime), size + st.st_size, paths + [path])
+    total = kept + sum(size for _, size, _ in docs.values())
+    for _, size, paths in sorted(docs.values()):
+        if total <= DISK_CACHE_BYTES:
+            break
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        total -= size
+
+
+def ingest(source, backend=None, digest=None):
+    # Extracts `source` (path or bytes) into the store unless it is already
+    # there, and returns its PdfDocument.
+    backend = resolve_backend(backend)
+    if digest is None:
+        digest = pdf_digest(source) if isinstance(source, bytes) else file_digest(source)
+    key = (digest, backend)
+    with _ingest_locks_lock:
+        lock = _ingest_locks.setdefault(key, threading.Lock())
+    try:
+        with lock:
+            doc = _open_stored(digest, backend)
+            if doc is not None:
+                metrics.inc("pdf_cache_total", result="hit")
+                return doc
+            metrics.inc("pdf_cache_total", result="miss")
+            with metrics.span("pdf_extract", backend=backend):
+                _write_store(source, digest, backend)
+            return PdfDocument(digest, backend)
+    finally:
+        with _ingest_locks_lock:
+            _ingest_locks.pop(key, None)
+
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(SPOOL_CHUNK), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def spool_upload(fileobj):
+    # Copies an uploaded file object to a temp file in fixed-size chunks,
+    # hashing as it goes. Returns (path, digest); the caller removes the file.
+    sha = hashlib.sha256()
+    fileobj.seek(0)
+    fd, path = tempfile.mkstemp(prefix="edubot-upload-", suffix=".pdf")
+    with os.fdopen(fd, "wb") as out:
+        for block in iter(lambda: fileobj.read(SPOOL_CHUNK), b""):
+            sha.update(block)
+            out.write(block)
+    return path, sha.hexdigest()
+
+
+def open_pdf_upload(fileobj, backend=None):
+    # Upload -> spool file -> streamed extraction into the store -> handle.
+    path, digest = spool_upload(fileobj)
+    try:
+        return ingest(path, backend, digest)
+    finally:
+        os.remove(path)
+
+
+# ───── whole-document helpers (kept for callers that want plain values) ─────
+def get_pdf_pages(data, backend=None, digest=None):
+    return list(ingest(data, backend, digest).iter_pages())
+
+
+def extract_pdf_text(data, backend=None, digest=None):
+    return ingest(data, backend, digest).text()
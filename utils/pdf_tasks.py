@@ -0,0 +1,57 @@
+# utils/pdf_tasks.py
+
+from utils.llm_client import LLMError
+from utils.response_cache import context_digest, get_response_cache
+from utils.summarizer import generate_questions_document, summarize_document
+from utils.text_compact import compacted_text
+
+# The PDF Summarize / Generate Questions flow and PDF-grounded chat, shared by
+# the Streamlit page and the HTTP API. Nothing here touches st.*, so it can
+# run on job threads and API worker threads alike.
+
+PDF_ACTIONS = {
+    "Summarize": summarize_document,
+    "Generate Questions": generate_questions_document,
+}
+
+
+def run_pdf_task(doc, action, ask, offline=False, progress=None):
+    # doc: PdfDocument; ask(messages) -> str (e.g. a model router asker).
+    # Large PDFs are chunked, summarized part-by-part in parallel and then
+    # reduced, so the prompt never has to hold the whole document.
+    # Returns (reply, note for the user or None).
+    from utils.qa_generator import generate_questions_markdown
+    if offline:
+        return generate_questions_markdown(compacted_text(doc)), None
+    # Same PDF + same task (from any user) is answered from the response cache
+    response_cache = get_response_cache()
+    cache_context = f"pdf:{doc.digest}"
+    reply = response_cache.get(action, cache_context)
+    if reply is None:
+        text = compacted_text(doc)
+        try:
+            reply = PDF_ACTIONS[action](text, ask, on_progress=progress)
+        except LLMError as e:
+            if action != "Generate Questions":
+                raise
+            # The local engine is the fallback when the AI service is down
+            return generate_questions_markdown(text), f"AI unavailable ({e}); generated the questions locally instead."
+        response_cache.put(action, reply, cache_context)
+    return reply, None
+
+
+def chat_cache_context(history, doc=None):
+    # Cached answers are scoped to the reply being followed up on, so a repeated
+    # opening question hits but "explain that again" mid-conversation does not
+    last_reply = next((m["content"] for m in reversed(history) if m["role"] == "assistant"), "")
+    context = f"chat:{context_digest(last_reply)}"
+    if doc is not None:
+        context += f":pdf:{doc.digest}"
+    return context
+
+
+def ground_in_pdf(messages, doc, query):
+    # Only the top-k matching passages of the PDF go into the prompt
+    from utils.retrieval import get_index, ground_messages
+    index = get_index(doc, lambda: compacted_text(doc))
+    return ground_messages(messages, index.search(query))
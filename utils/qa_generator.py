@@ -1,36 +1,232 @@
 # utils/qa_generator.py
 
 import random
+import re
 
-def generate_mcqs(text):
-    sentences = text.split(". ")
-    mcqs = []
+import numpy as np
 
-    for i in range(min(5, len(sentences))):
-        q = sentences[i].strip()
-        if len(q.split()) > 6:
-            answer = q.split()[-1].strip(".,")
-            options = random.sample(["Python", "Machine", "AI", answer, "Code"], 4)
-            random.shuffle(options)
+# Local, LLM-free question generation over the whole document:
+#   1. sentence segmentation
+#   2. keyphrase extraction (uni/bigram TF-IDF, sentences as documents)
+#   3. cloze MCQs whose distractors are other keyphrases of the same document
+#   4. short-answer questions from the most informative (definition-like) sentences
 
-            mcqs.append({
-                "question": f"What is related to: {q[:40]}...?",
+STOPWORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before
+being below between both but by can could did do does doing down during each even few for
+from further had has have having he her here hers herself him himself his how however i if
+in into is it its itself just may me might more most must my myself no nor not now of off
+on once only or other our ours ourselves out over own same shall she should so some such
+than that the their theirs them themselves then there these they this those through thus
+to too under until up upon us use used using very was we were what when where which while
+who whom why will with within without would yet you your yours yourself yourselves one two
+also e g i e etc figure fig table chapter section page example
+""".split())
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])|\n{2,}")
+_ABBREV_RE = re.compile(r"\b(e\.g|i\.e|etc|vs|Dr|Mr|Mrs|Ms|Fig|No|al)\.\s+", re.IGNORECASE)
+_WORD_RE = re.compile(r"[A-Za-z][A-Za-z0-9\-]+")
+_PHRASE_BREAK_RE = re.compile(r"[^\w\s\-]+")
+_DEFINITION_RE = re.compile(
+    r"^(?:(?:The|A|An)\s+)?(?P<term>[A-Za-z][\w\-]*(?:\s[\w\-]+){0,3}?)\s+"
+    r"(?P<verb>is|are|refers to|means|is defined as|describes)\s+"
+)
+
+MIN_WORDS, MAX_WORDS = 8, 45
+
+
+def split_sentences(text):
+    # Protect common abbreviations, split, then restore. Repeated sentences
+    # (running headers, boilerplate) are kept once.
+    text = _ABBREV_RE.sub(lambda m: m.group(0).replace(". ", ".\x00"), text)
+    sentences = {}
+    for raw in _SENTENCE_RE.split(text):
+        s = " ".join(raw.replace("\x00", " ").split())
+        if MIN_WORDS <= len(s.split()) <= MAX_WORDS:
+            sentences.setdefault(s, None)
+    return list(sentences)
+
+
+def _candidate_terms(sentence):
+    terms = []
+    # Bigrams never span punctuation ("importlib.abc", "x, y")
+    for segment in _PHRASE_BREAK_RE.split(sentence):
+        words = [w.lower() for w in _WORD_RE.findall(segment)]
+        keep = [w not in STOPWORDS and len(w) > 2 for w in words]
+        terms += [w for w, k in zip(words, keep) if k]
+        terms += [
+            f"{a} {b}" for (a, ka), (b, kb) in zip(zip(words, keep), zip(words[1:], keep[1:]))
+            if ka and kb and a != b
+        ]
+    return terms
+
+
+def extract_keyphrases(sentences):
+    # Returns (phrases, scores, sentence_term matrix rows) with TF-IDF scores
+    # computed over sentences. Counting is done with one np.unique over
+    # (term, sentence) pairs instead of per-term Python loops.
+    vocab, term_ids, sent_ids = {}, [], []
+    for s_id, sentence in enumerate(sentences):
+        for term in _candidate_terms(sentence):
+            term_ids.append(vocab.setdefault(term, len(vocab)))
+            sent_ids.append(s_id)
+    if not vocab:
+        return [], np.zeros(0), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    n_sent = len(sentences)
+    terms = np.asarray(term_ids, dtype=np.int64)
+    sents = np.asarray(sent_ids, dtype=np.int64)
+    pairs = np.unique(terms * n_sent + sents)
+    pair_terms, pair_sents = pairs // n_sent, pairs % n_sent
+    tf = np.bincount(terms, minlength=len(vocab)).astype(np.float64)
+    df = np.bincount(pair_terms, minlength=len(vocab)).astype(np.float64)
+    idf = np.log((1 + n_sent) / (1 + df)) + 1.0
+    scores = np.log1p(tf) * idf
+    # A phrase seen only once is rarely a key concept
+    scores[tf < 2] = 0.0
+    # Prefer bigrams over their constituent unigrams
+    phrases = [None] * len(vocab)
+    for term, idx in vocab.items():
+        phrases[idx] = term
+    is_bigram = np.fromiter((" " in p for p in phrases), dtype=bool, count=len(phrases))
+    scores[is_bigram] *= 1.5
+    return phrases, scores, pair_terms, pair_sents
+
+
+def _sentence_scores(n_sent, scores, pair_terms, pair_sents):
+    return np.bincount(pair_sents, weights=scores[pair_terms], minlength=n_sent)
+
+
+def _blank(sentence, phrase):
+    pattern = re.compile(r"\b" + re.escape(phrase).replace(r"\ ", r"\s+") + r"\b", re.IGNORECASE)
+    match = pattern.search(sentence)
+    if not match:
+        return None, None
+    return sentence[:match.start()] + "_____" + sentence[match.end():], match.group(0)
+
+
+def _match_case(phrase, like):
+    # Distractors are lowercase keyphrases while the answer keeps the text's
+    # casing ("TCP", "Gradient descent" opening a sentence); render them the
+    # same way so capitalisation doesn't give the answer away.
+    if like.isupper():
+        return phrase.upper()
+    if like.istitle():
+        return phrase.title()
+    if like[:1].isupper():
+        return phrase[:1].upper() + phrase[1:]
+    return phrase
+
+
+def _pick_distractors(answer_idx, phrases, ranked, position, used_words, rng, k=3, pool=8):
+    # Distractors come from the document's own vocabulary: keyphrases of the
+    # same shape (uni/bigram) and close in rank to the answer, sharing no
+    # words with it so exactly one option is correct. k are sampled from the
+    # `pool` nearest so different questions don't reuse the same three.
+    answer = phrases[answer_idx]
+    want_bigram = " " in answer
+    pos = position.get(answer_idx, 0)
+    answer_words = set(answer.split())
+    picks = []
+    for offset in range(1, len(ranked)):
+        for cand_pos in (pos - offset, pos + offset):
+            if not 0 <= cand_pos < len(ranked):
+                continue
+            cand = phrases[ranked[cand_pos]]
+            words = set(cand.split())
+            if (" " in cand) != want_bigram or words & answer_words or words & used_words:
+                continue
+            picks.append(cand)
+            used_words |= words
+        if len(picks) >= pool or (pos - offset < 0 and pos + offset >= len(ranked)):
+            break
+    return rng.sample(picks, min(k, len(picks)))
+
+
+class QuestionEngine:
+    def __init__(self, text, seed=None):
+        self.sentences = split_sentences(text)
+        self.phrases, self.scores, self.pair_terms, self.pair_sents = extract_keyphrases(self.sentences)
+        self.rng = random.Random(seed)
+        self.ranked = [int(i) for i in np.argsort(-self.scores) if self.scores[i] > 0]
+        self.position = {idx: pos for pos, idx in enumerate(self.ranked)}
+
+    def mcqs(self, n=10):
+        if not self.ranked:
+            return []
+        order = np.argsort(self.pair_terms, kind="stable")
+        sorted_terms = self.pair_terms[order]
+        sent_scores = _sentence_scores(len(self.sentences), self.scores, self.pair_terms, self.pair_sents)
+        used_sentences, questions = set(), []
+        for idx in self.ranked:
+            if len(questions) >= n:
+                break
+            lo, hi = np.searchsorted(sorted_terms, [idx, idx + 1])
+            candidates = [int(s) for s in self.pair_sents[order[lo:hi]] if int(s) not in used_sentences]
+            if not candidates:
+                continue
+            s_id = max(candidates, key=lambda s: sent_scores[s])
+            question, answer = _blank(self.sentences[s_id], self.phrases[idx])
+            if not question:
+                continue
+            distractors = _pick_distractors(idx, self.phrases, self.ranked, self.position,
+                                            set(answer.lower().split()), self.rng)
+            if len(distractors) < 3:
+                continue
+            options = [answer] + [_match_case(d, answer) for d in distractors]
+            self.rng.shuffle(options)
+            used_sentences.add(s_id)
+            questions.append({
+                "question": f"Fill in the blank: {question}",
                 "options": options,
                 "answer": answer
             })
+        return questions
 
-    return mcqs
+    def short_answers(self, n=5):
+        if not self.sentences:
+            return []
+        sent_scores = _sentence_scores(len(self.sentences), self.scores, self.pair_terms, self.pair_sents)
+        lengths = np.fromiter((len(s.split()) for s in self.sentences), dtype=np.float64, count=len(self.sentences))
+        density = sent_scores / np.sqrt(lengths)
+        questions = []
+        for s_id in np.argsort(-density):
+            if len(questions) >= n:
+                break
+            sentence = self.sentences[int(s_id)]
+            match = _DEFINITION_RE.match(sentence)
+            if match:
+                question = f"What {'are' if match.group('verb') == 'are' else 'is'} {match.group('term')}?"
+            else:
+                question = f"Explain: {sentence[:60].rstrip()}..."
+            if any(q["question"] == question for q in questions):
+                continue
+            questions.append({"question": question, "answer": sentence})
+        return questions
 
-def generate_short_answers(text):
-    sentences = text.split(". ")
-    questions = []
 
-    for i in range(min(3, len(sentences))):
-        q = sentences[i].strip()
-        if len(q.split()) > 5:
-            questions.append({
-                "question": f"Explain: {q[:50]}...",
-                "answer": q
-            })
+def generate_mcqs(text, n=10, seed=None):
+    return QuestionEngine(text, seed).mcqs(n)
+
+
+def generate_short_answers(text, n=5, seed=None):
+    return QuestionEngine(text, seed).short_answers(n)
+
 
-    return questions
+def generate_questions_markdown(text, n_mcq=10, n_short=5, seed=None):
+    # Chat-ready rendering used as the offline / fast path for "Generate Questions".
+    engine = QuestionEngine(text, seed)
+    mcqs, shorts = engine.mcqs(n_mcq), engine.short_answers(n_short)
+    if not mcqs and not shorts:
+        return "I couldn't find enough text in this PDF to build questions from."
+    lines = []
+    if mcqs:
+        lines.append("Multiple-choice questions:")
+        for i, q in enumerate(mcqs, 1):
+            lines.append(f"\n{i}. {q['question']}")
+            lines.extend(f"   {chr(97 + j)}) {opt}" for j, opt in enumerate(q["options"]))
+            lines.append(f"   Answer: {q['answer']}")
+    if shorts:
+        lines.append("\nShort-answer questions:")
+        for i, q in enumerate(shorts, 1):
+            lines.append(f"\n{i}. {q['question']}\n   Model answer: {q['answer']}")
+    return "\n".join(lines)
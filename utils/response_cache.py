@@ -0,0 +1,214 @@
+# utils/response_cache.py
+
+import hashlib
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from utils import metrics
+
+# EDUBOT_RESPONSE_CACHE=<path.sqlite3> persists entries across restarts;
+# EDUBOT_CACHE_NEAR_DUP=1 also serves near-duplicate prompts (MinHash).
+CACHE_PATH = os.getenv("EDUBOT_RESPONSE_CACHE")
+NEAR_DUPLICATES = os.getenv("EDUBOT_CACHE_NEAR_DUP", "0") == "1"
+MAX_ENTRIES = 2048
+TTL_SECONDS = 7 * 24 * 60 * 60
+NEAR_DUP_THRESHOLD = 0.7   # estimated Jaccard similarity of word 2-shingles
+
+MINHASH_PERM = 128
+MINHASH_BANDS = 32         # 32 bands x 4 rows
+_MERSENNE = (1 << 61) - 1
+_rng = random.Random(1234)  # fixed seed: signatures must be stable across restarts
+_PERMS = [(_rng.randrange(1, _MERSENNE), _rng.randrange(0, _MERSENNE)) for _ in range(MINHASH_PERM)]
+
+_SPACE_RE = re.compile(r"\s+")
+_WORD_RE = re.compile(r"\w+")
+
+
+def normalize_prompt(text):
+    # Exact-match form: only case and whitespace are ignored, so "C++" and
+    # "C#", or prompts in any script, never share a key
+    return _SPACE_RE.sub(" ", text.casefold()).strip()
+
+
+def _similarity_words(normalized):
+    # The lossy form, for the near-duplicate tier only
+    return " ".join(_WORD_RE.findall(normalized))
+
+
+def cache_key(prompt, context=""):
+    # context scopes the entry: e.g. "pdf:<sha256>:Summarize" or the previous reply
+    raw = f"{context}\x00{normalize_prompt(prompt)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def context_digest(text):
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()[:16]
+
+
+# ───── MinHash for near-duplicate lookups ─────
+def _shingles(normalized, size=2):
+    words = normalized.split()
+    if len(words) < size:
+        return {normalized}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash(normalized):
+    hashes = [zlib.crc32(s.encode("utf-8")) for s in _shingles(_similarity_words(normalized))]
+    return tuple(min((a * h + b) % _MERSENNE for h in hashes) for a, b in _PERMS)
+
+
+def _bands(signature):
+    rows = MINHASH_PERM // MINHASH_BANDS
+    return [(i, signature[i * rows:(i + 1) * rows]) for i in range(MINHASH_BANDS)]
+
+
+def _similarity(sig_a, sig_b):
+    return sum(a == b for a, b in zip(sig_a, sig_b)) / MINHASH_PERM
+
+
+class ResponseCache:
+    # LRU + TTL cache of LLM replies keyed on the normalized prompt plus a
+    # context string (PDF content hash, task name, ...). Optional write-through
+    # persistence in SQLite and optional MinHash/LSH near-duplicate matching.
+
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=TTL_SECONDS, path=None,
+                 near_duplicates=False, threshold=NEAR_DUP_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.near_duplicates = near_duplicates
+        self.threshold = threshold
+        self._entries = OrderedDict()   # key -> (value, created, context, signature)
+        self._lsh = {}                  # (context, band, rows) -> set of keys
+        self._lock = threading.RLock()
+        self.hits = self.near_hits = self.misses = self.evictions = 0
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, context TEXT, prompt TEXT, value TEXT, created REAL)"
+            )
+            self._load()
+
+    def _load(self):
+        rows = self._db.execute(
+            "SELECT key, context, prompt, value, created FROM responses "
+            "WHERE created >= ? ORDER BY created DESC LIMIT ?",
+            (time.time() - self.ttl, self.max_entries)
+        ).fetchall()
+        for key, context, prompt, value, created in reversed(rows):
+            self._insert(key, value, created, context, prompt)
+
+    # ───── internals ─────
+    def _insert(self, key, value, created, context, normalized):
+        signature = minhash(normalized) if self.near_duplicates else None
+        self._entries[key] = (value, created, context, signature)
+        self._entries.move_to_end(key)
+        if signature:
+            for band in _bands(signature):
+                self._lsh.setdefault((context,) + band, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        _, _, context, signature = self._entries.pop(key)
+        if signature:
+            for band in _bands(signature):
+                bucket = self._lsh.get((context,) + band)
+                if bucket is not None:
+                    bucket.discard(key)
+                    if not bucket:
+                        del self._lsh[(context,) + band]
+        if self._db:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._db.commit()
+
+    def _expired(self, created):
+        return time.time() - created > self.ttl
+
+    def _near_lookup(self, normalized, context):
+        signature = minhash(normalized)
+        candidates = set()
+        for band in _bands(signature):
+            candidates |= self._lsh.get((context,) + band, set())
+        best, best_score = None, self.threshold
+        for key in candidates:
+            score = _similarity(signature, self._entries[key][3])
+            if score >= best_score:
+                best, best_score = key, score
+        return best
+
+    # ───── public API ─────
+    def get(self, prompt, context=""):
+        with self._lock:
+            key = cache_key(prompt, context)
+            if key not in self._entries and self.near_duplicates:
+                near = self._near_lookup(normalize_prompt(prompt), context)
+                if near is not None:
+                    self.near_hits += 1
+                    key = near
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry[1]):
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, prompt, value, context=""):
+        with self._lock:
+            key = cache_key(prompt, context)
+            normalized = normalize_prompt(prompt)
+            created = time.time()
+            self._insert(key, value, created, context, normalized)
+            if self._db:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, context, prompt, value, created) VALUES (?, ?, ?, ?, ?)",
+                    (key, context, normalized, value, created)
+                )
+                self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._lsh.clear()
+            if self._db:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(path=CACHE_PATH, near_duplicates=NEAR_DUPLICATES)
+            metrics.register_collector(
+                lambda: {f"response_cache_{k}": v for k, v in _cache.stats().items()}
+            )
+        return _cache
@@ -0,0 +1,151 @@
+# utils/retrieval.py
+
+import json
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.summarizer import chunk_text
+
+CHUNK_TOKENS = 250     # passage size for retrieval
+TOP_K = 4
+BM25_K1 = 1.5
+BM25_B = 0.75
+MEMORY_INDEXES = 8
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have how i in is it its of on or that the this to
+was what when where which who why will with you your do does did can could should would
+me my we our about into than then there these those they them not no so if but
+""".split())
+
+
+def tokenize(text):
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in STOPWORDS and len(t) > 1]
+
+
+class BM25Index:
+    # BM25 over fixed-size passages of one document. Postings are stored
+    # CSR-style (term -> slice of doc_ids/tfs) in NumPy arrays, so a query is
+    # a handful of vectorised scatter-adds, and the whole index round-trips
+    # through one .npz + one .json file.
+
+    def __init__(self, chunks, vocab, indptr, doc_ids, tfs, doc_len):
+        self.chunks = chunks
+        self.vocab = vocab                      # term -> term id
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_len = doc_len
+        n_docs = len(chunks)
+        df = np.diff(indptr).astype(np.float64)
+        self.idf = np.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+        avgdl = doc_len.mean() if n_docs else 1.0
+        self._norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_len / max(avgdl, 1e-9))
+
+    @classmethod
+    def build(cls, text, chunk_tokens=CHUNK_TOKENS):
+        chunks = chunk_text(text, chunk_tokens)
+        vocab = {}
+        term_ids, doc_ids = [], []
+        doc_len = np.zeros(len(chunks), dtype=np.float64)
+        for d, chunk in enumerate(chunks):
+            tokens = tokenize(chunk)
+            doc_len[d] = len(tokens)
+            term_ids.extend(vocab.setdefault(t, len(vocab)) for t in tokens)
+            doc_ids.extend([d] * len(tokens))
+        n_docs = max(len(chunks), 1)
+        # Count (term, doc) pairs in one pass, then lay them out sorted by term
+        keys = np.asarray(term_ids, dtype=np.int64) * n_docs + np.asarray(doc_ids, dtype=np.int64)
+        pairs, tfs = np.unique(keys, return_counts=True)
+        terms = pairs // n_docs
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(vocab)), out=indptr[1:])
+        return cls(chunks, vocab, indptr, (pairs % n_docs).astype(np.int32),
+                   tfs.astype(np.float64), doc_len)
+
+    def search(self, query, k=TOP_K):
+        if not self.chunks:
+            return []
+        scores = np.zeros(len(self.chunks), dtype=np.float64)
+        for term in set(tokenize(query)):
+            t = self.vocab.get(term)
+            if t is None:
+                continue
+            sl = slice(self.indptr[t], self.indptr[t + 1])
+            docs, tf = self.doc_ids[sl], self.tfs[sl]
+            scores[docs] += self.idf[t] * tf * (BM25_K1 + 1) / (tf + self._norm[docs])
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.chunks[i]) for i in top if scores[i] > 0]
+
+    # ───── persistence ─────
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # ".tmp": the document store's eviction skips files still being written
+        with tempfile.NamedTemporaryFile("wb", dir=os.path.dirname(path), suffix=".tmp", delete=False) as f:
+            np.savez(f, indptr=self.indptr, doc_ids=self.doc_ids, tfs=self.tfs, doc_len=self.doc_len)
+        os.replace(f.name, path + ".npz")
+        with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(path), suffix=".tmp",
+                                         delete=False, encoding="utf-8") as f:
+            json.dump({"chunks": self.chunks, "vocab": self.vocab}, f)
+        os.replace(f.name, path + ".json")
+
+    @classmethod
+    def load(cls, path):
+        with open(path + ".json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with np.load(path + ".npz", allow_pickle=False) as arrays:
+            return cls(meta["chunks"], meta["vocab"], arrays["indptr"], arrays["doc_ids"],
+                       arrays["tfs"], arrays["doc_len"])
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def _index_path(doc):
+    # Beside the document's store entry, so the PDF store's size budget and
+    # LRU eviction cover the index too
+    return doc.text_path[:-len(".txt")] + ".bm25"
+
+
+def get_index(doc, text):
+    # Index of `doc` (a PdfDocument): memory LRU, then disk, then build (and
+    # persist) from the extracted text. `text` may be a callable (e.g.
+    # PdfDocument.text) so the document is only read on a miss.
+    path = _index_path(doc)
+    with _indexes_lock:
+        if path in _indexes:
+            _indexes.move_to_end(path)
+            return _indexes[path]
+    try:
+        index = BM25Index.load(path)
+    except (FileNotFoundError, ValueError, KeyError):
+        index = BM25Index.build(text() if callable(text) else text)
+        index.save(path)
+    with _indexes_lock:
+        _indexes[path] = index
+        while len(_indexes) > MEMORY_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def ground_messages(messages, passages):
+    # Inserts the retrieved passages as a system message right before the
+    # latest user turn, so only the relevant excerpts reach the LLM.
+    if not passages:
+        return messages
+    excerpts = "\n\n".join(f"[{i + 1}] {chunk}" for i, (_, chunk) in enumerate(passages))
+    note = {
+        "role": "system",
+        "content": "Relevant excerpts from the student's uploaded PDF. Use them when they help "
+                   f"answer the next question, and say so when they don't cover it:\n\n{excerpts}"
+    }
+    return messages[:-1] + [note] + messages[-1:]
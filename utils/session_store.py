@@ -0,0 +1,151 @@
+# utils/session_store.py
+
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+
+# Login sessions live on the server. The browser cookie only carries an
+# opaque token "<session id>.<HMAC of the id>"; the signature is checked
+# before the in-memory table is consulted, so forged or guessed cookies
+# never reach the lookup and auto-login needs no users.json parse.
+
+SESSION_COOKIE = "eduyy_session"
+SESSION_TTL = 7 * 24 * 60 * 60            # seconds; matches the cookie expiry
+SESSION_DB = os.getenv("EDUBOT_SESSION_DB")      # optional SQLite persistence
+SESSION_SECRET = os.getenv("EDUBOT_SESSION_SECRET")
+PURGE_INTERVAL = 300                       # seconds between expired-session sweeps
+
+
+def _b64(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+class SessionStore:
+    def __init__(self, ttl=SESSION_TTL, path=None, secret=None):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._sessions = {}            # session id -> (username, expires)
+        self._last_purge = time.time()
+        self._db = None
+        if path:
+            import sqlite3
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, username TEXT, expires REAL)"
+            )
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            secret = secret or self._stored_secret()
+            self._load()
+        # Without a configured secret, tokens only need to outlive this process
+        self._secret = (secret or secrets.token_hex(32)).encode()
+
+    def _stored_secret(self):
+        # Persisted sessions must survive a restart, so must the signing key
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'secret'").fetchone()
+        if row:
+            return row[0]
+        secret = secrets.token_hex(32)
+        self._db.execute("INSERT INTO meta (key, value) VALUES ('secret', ?)", (secret,))
+        self._db.commit()
+        return secret
+
+    def _load(self):
+        now = time.time()
+        self._db.execute("DELETE FROM sessions WHERE expires < ?", (now,))
+        self._db.commit()
+        for sid, username, expires in self._db.execute("SELECT sid, username, expires FROM sessions"):
+            self._sessions[sid] = (username, expires)
+
+    # ───── tokens ─────
+    def _sign(self, sid):
+        return _b64(hmac.new(self._secret, sid.encode(), hashlib.sha256).digest())
+
+    def _session_id(self, token):
+        # Returns the session id of a well-formed, correctly signed token.
+        # Real tokens are ASCII; compare_digest raises TypeError on anything else.
+        if not token or not token.isascii() or token.count(".") != 1:
+            return None
+        sid, signature = token.split(".")
+        if not hmac.compare_digest(signature, self._sign(sid)):
+            return None
+        return sid
+
+    # ───── public API ─────
+    def create(self, username):
+        sid = secrets.token_urlsafe(24)
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._sessions[sid] = (username, expires)
+            if self._db:
+                self._db.execute("INSERT INTO sessions (sid, username, expires) VALUES (?, ?, ?)",
+                                 (sid, username, expires))
+                self._db.commit()
+        return f"{sid}.{self._sign(sid)}"
+
+    def validate(self, token):
+        # Username for a live session, else None
+        sid = self._session_id(token)
+        if sid is None:
+            return None
+        now = time.time()
+        with self._lock:
+            if now - self._last_purge > PURGE_INTERVAL:
+                self._purge(now)
+            entry = self._sessions.get(sid)
+            if entry is None:
+                return None
+            if entry[1] < now:
+                self._drop([sid])
+                return None
+            return entry[0]
+
+    def revoke(self, token):
+        sid = self._session_id(token)
+        if sid is None:
+            return
+        with self._lock:
+            if sid in self._sessions:
+                self._drop([sid])
+
+    def revoke_user(self, username):
+        # Log a user out everywhere (e.g. after a password reset)
+        with self._lock:
+            self._drop([sid for sid, (user, _) in self._sessions.items() if user == username])
+
+    def __len__(self):
+        return len(self._sessions)
+
+    # ───── internals (caller holds the lock) ─────
+    def _drop(self, sids):
+        for sid in sids:
+            self._sessions.pop(sid, None)
+        if self._db and sids:
+            self._db.executemany("DELETE FROM sessions WHERE sid = ?", [(sid,) for sid in sids])
+            self._db.commit()
+
+    def _purge(self, now):
+        self._last_purge = now
+        self._drop([sid for sid, (_, expires) in self._sessions.items() if expires < now])
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SessionStore(path=SESSION_DB, secret=SESSION_SECRET)
+        return _store
+
+
+def session_user(cookies):
+    # The one validation path both pages use. `cookies` is st.context.cookies,
+    # which Streamlit fills from the page request, so no JS round trip.
+    token = (cookies or {}).get(SESSION_COOKIE)
+    return get_session_store().validate(token) if token else None
@@ -0,0 +1,144 @@
+# utils/summarizer.py
+
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from utils.tokens import estimate_tokens, tokens_to_chars
+
+CHUNK_TOKENS = 3000      # input tokens per map call
+REDUCE_TOKENS = 6000     # max combined partial results per reduce call
+MAX_WORKERS = 4          # concurrent map calls against the LLM
+
+SUMMARY_PROMPTS = {
+    "single": "Summarize the following text:\n{text}",
+    "map": "Summarize this part ({index} of {total}) of a longer document. Keep key facts, definitions and numbers:\n{text}",
+    "reduce": "Combine these partial summaries of one document into a single coherent summary:\n{text}",
+}
+QUESTION_PROMPTS = {
+    "single": "Generate interview/exam-style questions from the following text:\n{text}",
+    "map": "Generate interview/exam-style questions from this part ({index} of {total}) of a longer document:\n{text}",
+    "reduce": "Merge these question lists from one document into a single well-organised list. Remove duplicates and keep the best questions:\n{text}",
+}
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+# ───── chunking ─────
+def _pieces(text, max_chars):
+    # Paragraphs, falling back to sentences, falling back to hard cuts, so no
+    # piece is larger than max_chars.
+    for para in _PARAGRAPH_RE.split(text):
+        if len(para) <= max_chars:
+            yield para
+            continue
+        for sent in _SENTENCE_RE.split(para):
+            for start in range(0, len(sent), max_chars):
+                yield sent[start:start + max_chars]
+
+
+def chunk_text(text, max_tokens=CHUNK_TOKENS):
+    max_chars = tokens_to_chars(max_tokens)
+    chunks, current, size = [], [], 0
+    for piece in _pieces(text, max_chars):
+        piece = piece.strip()
+        if not piece:
+            continue
+        if current and size + len(piece) + 1 > max_chars:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += len(piece) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+# ───── map / reduce ─────
+def _call(ask, prompt):
+    return ask([{"role": "user", "content": prompt}])
+
+
+def _group(parts, max_tokens):
+    groups, current, size = [], [], 0
+    for part in parts:
+        tokens = estimate_tokens(part)
+        if current and size + tokens > max_tokens:
+            groups.append(current)
+            current, size = [], 0
+        current.append(part)
+        size += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+def map_reduce(text, ask, prompts, chunk_tokens=CHUNK_TOKENS, reduce_tokens=REDUCE_TOKENS,
+               max_workers=MAX_WORKERS, on_progress=None):
+    # ask(messages) -> str is the chat-completions call, usually a model
+    # router asker; an LLMError from any part aborts the task. Parts run on
+    # this call's own worker pool. on_progress(done, total) is called from the
+    # calling thread (a background job's thread when run via utils.jobs,
+    # which only records the numbers), never from the pool workers.
+    chunks = chunk_text(text, chunk_tokens)
+    if len(chunks) <= 1:
+        if on_progress:
+            on_progress(0, 1)
+        result = _call(ask, prompts["single"].format(text=text))
+        if on_progress:
+            on_progress(1, 1)
+        return result
+
+    total = len(chunks) + 1  # grows if the reduce step needs more than one level
+    done = 0
+    if on_progress:
+        on_progress(done, total)
+
+    partials = [None] * len(chunks)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        try:
+            futures = {
+                pool.submit(_call, ask, prompts["map"].format(index=i + 1, total=len(chunks), text=chunk)): i
+                for i, chunk in enumerate(chunks)
+            }
+            for future in as_completed(futures):
+                partials[futures[future]] = future.result()
+                done += 1
+                if on_progress:
+                    on_progress(done, total)
+
+            # Hierarchical reduce: keep merging groups until one call can take
+            # them all (or until grouping stops shrinking the list).
+            while True:
+                groups = _group(partials, reduce_tokens)
+                if len(groups) == 1 or len(groups) == len(partials):
+                    break
+                total += len(groups)
+                futures = {
+                    pool.submit(_call, ask, prompts["reduce"].format(text="\n\n".join(g))): i
+                    for i, g in enumerate(groups)
+                }
+                partials = [None] * len(groups)
+                for future in as_completed(futures):
+                    partials[futures[future]] = future.result()
+                    done += 1
+                    if on_progress:
+                        on_progress(done, total)
+        except BaseException:
+            # Without this the pool would still run every queued part of a
+            # task that has already failed, each one a billed LLM call
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    result = _call(ask, prompts["reduce"].format(text="\n\n".join(partials)))
+    if on_progress:
+        on_progress(total, total)
+    return result
+
+
+def summarize_document(text, ask, **kwargs):
+    return map_reduce(text, ask, SUMMARY_PROMPTS, **kwargs)
+
+
+def generate_questions_document(text, ask, **kwargs):
+    return map_reduce(text, ask, QUESTION_PROMPTS, **kwargs)
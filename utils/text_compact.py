@@ -0,0 +1,148 @@
+# utils/text_compact.py
+
+import json
+import os
+import re
+import tempfile
+from collections import Counter
+
+from utils import metrics
+from utils.tokens import CHARS_PER_TOKEN
+
+# Normalization between PDF extraction and prompt building. Every pass is a
+# single scan over the text:
+#   1. lines repeated at the top/bottom of many pages (running headers,
+#      footers) and bare page numbers are dropped
+#   2. words hyphenated across a line break are rejoined
+#   3. lines wrapped mid-sentence are joined back into paragraphs
+#   4. whitespace runs are collapsed
+EDGE_LINES = 3            # lines at each end of a page checked for boilerplate
+REPEAT_RATIO = 0.5        # share of pages an edge line must appear on
+MIN_PAGES = 3             # below this, nothing counts as repeated
+
+_PAGE_NUMBER_RE = re.compile(r"^(?:page\s*)?(?:\d+|[ivxlc]{1,5})(?:\s*(?:of|/)\s*\d+)?$", re.IGNORECASE)
+_DIGITS_RE = re.compile(r"\d+")
+_HYPHEN_RE = re.compile(r"(\w)-\n(?=[a-z])")
+_WRAP_RE = re.compile(r"(?<![.!?:;\n])\n(?=[^\S\n]*[a-z(\[\"'])")
+_SPACES_RE = re.compile(r"[^\S\n]+")
+_BLANK_RE = re.compile(r"\n{3,}")
+
+
+def _edge_key(line):
+    # "Chapter 3 - Page 12" and "Chapter 3 - Page 13" are the same footer
+    return _DIGITS_RE.sub("#", " ".join(line.lower().split()))
+
+
+def _edges(lines):
+    filled = [i for i, line in enumerate(lines) if line.strip()]
+    return set(filled[:EDGE_LINES] + filled[-EDGE_LINES:])
+
+
+def _repeated_edges(pages):
+    # First pass: keys of edge lines found on enough pages to be running
+    # headers/footers. Only the counts are kept, never the pages.
+    counts, n_pages = Counter(), 0
+    for page in pages:
+        lines = page.splitlines()
+        counts.update({_edge_key(lines[i]) for i in _edges(lines)})
+        n_pages += 1
+    threshold = max(MIN_PAGES, REPEAT_RATIO * n_pages)
+    return {key for key, n in counts.items() if n >= threshold and key.strip("# ")}
+
+
+def _compact_page(page, repeated):
+    # Returns (compacted page text, original chars, lines dropped). Pages are
+    # separate paragraphs, so each is normalized on its own.
+    lines = page.splitlines()
+    edges = _edges(lines)
+    kept, original_chars, dropped = [], 0, 0
+    for i, line in enumerate(lines):
+        original_chars += len(line) + 1
+        stripped = line.strip()
+        if i in edges and (_PAGE_NUMBER_RE.match(stripped) or _edge_key(line) in repeated):
+            dropped += 1
+            continue
+        kept.append(stripped)
+    text = "\n".join(kept)
+    text = _HYPHEN_RE.sub(r"\1", text)
+    text = _WRAP_RE.sub(" ", text)
+    text = _SPACES_RE.sub(" ", text)
+    text = _BLANK_RE.sub("\n\n", text).strip()
+    return text, original_chars, dropped
+
+
+def _compact(iter_pages, write):
+    # iter_pages() yields the page texts and is called twice; write(str)
+    # receives the compacted text a page at a time. Returns the stats.
+    repeated = _repeated_edges(iter_pages())
+    original_chars = dropped = chars = 0
+    for page in iter_pages():
+        text, page_chars, page_dropped = _compact_page(page, repeated)
+        original_chars += page_chars
+        dropped += page_dropped
+        if text:
+            piece = ("\n\n" if chars else "") + text
+            write(piece)
+            chars += len(piece)
+    write("\n")
+    chars += 1
+
+    before = -(-original_chars // CHARS_PER_TOKEN)
+    after = -(-chars // CHARS_PER_TOKEN)
+    stats = {
+        "tokens_before": before,
+        "tokens_after": after,
+        "tokens_saved": max(0, before - after),
+        "lines_dropped": dropped,
+    }
+    metrics.inc("pdf_compaction_tokens_saved_total", stats["tokens_saved"])
+    return stats
+
+
+def compact_pages(pages):
+    # pages: iterable of page texts. Returns (text, stats).
+    pages = list(pages)
+    parts = []
+    stats = _compact(lambda: iter(pages), parts.append)
+    return "".join(parts), stats
+
+
+# ───── cached per document next to the PDF store entry ─────
+def _compact_paths(doc):
+    base = doc.text_path[:-len(".txt")]
+    return base + ".compact.txt", base + ".compact.json"
+
+
+def compaction_stats(doc):
+    # Compacts `doc` (a PdfDocument) once and returns the stats; the text is
+    # written beside the document so it is evicted together with it.
+    text_path, stats_path = _compact_paths(doc)
+    try:
+        with open(stats_path, "r", encoding="utf-8") as f:
+            stats = json.load(f)
+        if os.path.exists(text_path):
+            return stats
+    except (FileNotFoundError, json.JSONDecodeError):
+        pass
+    # Streamed: two passes over the mmapped pages, output written page by
+    # page, so the document is never held in memory whole
+    directory = os.path.dirname(text_path)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            stats = _compact(doc.iter_pages, f.write)
+        os.replace(tmp, text_path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(stats, f)
+    os.replace(tmp, stats_path)
+    return stats
+
+
+def compacted_text(doc):
+    compaction_stats(doc)
+    with open(_compact_paths(doc)[0], "r", encoding="utf-8") as f:
+        return f.read()
@@ -0,0 +1,23 @@
+# utils/tokens.py
+
+import math
+
+# No tokenizer ships with the app, so token counts are estimated with the
+# usual ~4 characters per token rule of thumb for English text. It is O(1)
+# and errs on the high side for prose, which is what budgeting needs.
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4  # role + chat-template framing per message
+
+
+def estimate_tokens(text):
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def estimate_message_tokens(message):
+    return estimate_tokens(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+
+
+def tokens_to_chars(tokens):
+    return tokens * CHARS_PER_TOKEN
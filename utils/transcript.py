@@ -0,0 +1,56 @@
+# utils/transcript.py
+
+PAGE_SIZE = 40    # messages shown per "load earlier messages" step
+BLOCK_SIZE = 10   # messages rendered into one st.markdown element
+
+
+def message_html(role, msg):
+    cls = "user" if role == "user" else "bot"
+    label = "You" if role == "user" else "EduBot"
+    return f"""<div class='chat-row {cls}'>
+                <div class='chat-role'>{label}</div>
+                <div class='chat-content'>{msg}</div>
+            </div>"""
+
+
+class TranscriptRenderer:
+    # Renders the chat history as fixed blocks of BLOCK_SIZE messages aligned
+    # to their absolute position. History is append-only, so every full block
+    # renders to byte-identical HTML on each rerun: it is built once and
+    # cached here, and Streamlit's client-side message cache can skip
+    # resending it. Only the last, still-growing block changes per turn.
+
+    def __init__(self, page_size=PAGE_SIZE, block_size=BLOCK_SIZE):
+        self.page_size = page_size
+        self.block_size = block_size
+        self.pages = 1                 # how many pages of recent history are shown
+        self._blocks = {}              # block index -> (message count, html)
+
+    def reset(self):
+        self.pages = 1
+        self._blocks.clear()
+
+    def load_earlier(self):
+        self.pages += 1
+
+    def visible_start(self, total):
+        start = max(0, total - self.pages * self.page_size)
+        return start - start % self.block_size
+
+    def _block_html(self, history, index):
+        messages = history[index * self.block_size:(index + 1) * self.block_size]
+        cached = self._blocks.get(index)
+        if cached and cached[0] == len(messages):
+            return cached[1]
+        html = "".join(message_html(m["role"], m["content"]) for m in messages)
+        self._blocks[index] = (len(messages), html)
+        return html
+
+    def render_blocks(self, history):
+        total = len(history)
+        # A shorter history than what we cached means it was cleared/replaced
+        if self._blocks and max(self._blocks) * self.block_size >= total:
+            self._blocks.clear()
+        first = self.visible_start(total) // self.block_size
+        last = -(-total // self.block_size)
+        return [self._block_html(history, i) for i in range(first, last)]
@@ -0,0 +1,145 @@
+# utils/user_store.py
+
+import json
+import os
+import re
+import tempfile
+import threading
+
+from utils import metrics
+
+USERS_FILE = "users.json"
+# Usernames end up in file names (history, archives), so no path separators
+# or dot segments: letters, digits, "_", "-" and inner dots only
+USERNAME_RE = re.compile(r"^[A-Za-z0-9_-](?:[A-Za-z0-9_.-]{0,62}[A-Za-z0-9_-])?$")
+
+
+def valid_username(username):
+    return bool(USERNAME_RE.match(username or "")) and ".." not in username
+
+
+class UserStore:
+    # Keeps users.json parsed in process with username/email hash indexes.
+    # The file is only re-parsed when its mtime/size changes, so lookups on
+    # every Streamlit rerun are a stat() plus a dict get.
+
+    def __init__(self, path=USERS_FILE):
+        self.path = os.path.abspath(path)
+        self._lock = threading.RLock()
+        self._stamp = None
+        self._data = {"users": []}
+        self._by_username = {}
+        self._by_email = {}
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _reindex(self):
+        self._by_username = {u["username"]: u for u in self._data["users"]}
+        self._by_email = {u["email"]: u for u in self._data["users"]}
+
+    def _refresh(self):
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            return
+        if stamp is None:
+            self._data = {"users": []}
+        else:
+            with metrics.span("users_parse"), open(self.path, "r") as file:
+                self._data = json.load(file)
+        self._stamp = stamp
+        self._reindex()
+
+    def _write(self):
+        # Write to a temp file in the same directory and rename over the
+        # original, so a crash never leaves a truncated users.json behind.
+        directory = os.path.dirname(self.path)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".users.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as file:
+                json.dump(self._data, file, indent=4)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self._stamp = self._file_stamp()
+
+    # ───── reads ─────
+    @metrics.timed("load_users")
+    def load(self):
+        with self._lock:
+            self._refresh()
+            return self._data
+
+    @metrics.timed("user_lookup")
+    def get_by_username(self, username):
+        with self._lock:
+            self._refresh()
+            return self._by_username.get(username)
+
+    def get_by_email(self, email):
+        with self._lock:
+            self._refresh()
+            return self._by_email.get(email)
+
+    def username_exists(self, username):
+        return self.get_by_username(username) is not None
+
+    def email_exists(self, email):
+        return self.get_by_email(email) is not None
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return len(self._data["users"])
+
+    # ───── writes ─────
+    def save(self, users):
+        with self._lock:
+            self._data = users
+            self._reindex()
+            self._write()
+
+    def add_user(self, user):
+        if not valid_username(user["username"]):
+            raise ValueError(f"Invalid username: {user['username']!r}")
+        with self._lock:
+            self._refresh()
+            self._data["users"].append(user)
+            self._by_username[user["username"]] = user
+            self._by_email[user["email"]] = user
+            self._write()
+
+    def update_user(self, username, **fields):
+        with self._lock:
+            self._refresh()
+            user = self._by_username.get(username)
+            if user is None:
+                return False
+            if "email" in fields:
+                self._by_email.pop(user["email"], None)
+            user.update(fields)
+            self._by_email[user["email"]] = user
+            self._write()
+            return True
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_user_store(path=USERS_FILE):
+    # One shared store per file for the whole process (all pages / sessions).
+    key = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = UserStore(key)
+        return store